@@ -6,10 +6,6 @@ import sys
 
 sys.path.append(os.path.dirname(sys.path[0]))
 
-from PyQt5.QtWidgets import QApplication
-from quamash import QEventLoop
-
-from feeluown.app import App
 from feeluown.consts import (HOME_DIR, USER_PLUGINS_DIR, PLUGINS_DIR, DATA_DIR,
                              CACHE_DIR, USER_THEMES_DIR, SONG_DIR)
 from feeluown.config import config
@@ -46,6 +42,12 @@ sys.path.append(USER_PLUGINS_DIR)
 def main():
     parse_args(sys.argv)
 
+    # import the app graph only when app is started, after logging is
+    # configured
+    from PyQt5.QtWidgets import QApplication
+    from quamash import QEventLoop
+    from feeluown.app import App
+
     q_app = QApplication(sys.argv)
     q_app.setQuitOnLastWindowClosed(True)
     q_app.setApplicationName('FeelUOwn')
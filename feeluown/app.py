@@ -1,19 +1,25 @@
 import asyncio
 import logging
+import time
 from functools import partial
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QEvent
 from PyQt5.QtGui import QPainter, QImage, QPixmap, QIcon
 from PyQt5.QtMultimedia import QMediaPlayer
 from PyQt5.QtWidgets import QApplication
 
 from feeluown.widgets.base import FFrame
+from .bandwidth import BandwidthScheduler
 from .consts import DEFAULT_THEME_NAME, APP_ICON
+from .history import PlayHistory
 from .hotkey import Hotkey
 from .img_ctl import ImgController
+from .lyric import LyricManager
 from .player import Player
 from .player_mode import PlayerModeManager
 from .plugin import PluginsManager
+from .position import PositionBroadcaster
+from .queue_store import QueueStore
 from .request import Request
 from .server import Server
 from .theme import ThemeManager
@@ -29,9 +35,16 @@ class App(FFrame):
 
     def __init__(self):
         super().__init__()
+        self._painted = False
+        self._init_ts = time.perf_counter()
         self.player = Player(self)
         self.player_mode_manager = PlayerModeManager(self)
+        self.position_broadcaster = PositionBroadcaster(self)
+        self.lyric_manager = LyricManager(self)
+        self.queue_store = QueueStore(self)
+        self.play_history = PlayHistory(self)
         self.request = Request(self)
+        self.bandwidth_scheduler = BandwidthScheduler(self)
         self.server = Server(self)
         self.theme_manager = ThemeManager(self)
         self.tips_manager = TipsManager(self)
@@ -50,6 +63,8 @@ class App(FFrame):
         self.setObjectName('app')
         QApplication.setWindowIcon(QIcon(APP_ICON))
         self.set_theme_style()
+        # apply styles compiled when widgets are created
+        self.theme_manager.apply()
 
         self.bind_signal()
         self.test()
@@ -61,7 +76,8 @@ class App(FFrame):
         pms_btn = top_panel.pc_panel.pms_btn
 
         self.player.stateChanged.connect(self._on_player_status_changed)
-        self.player.positionChanged.connect(self._on_player_position_changed)
+        self.position_broadcaster.position_changed.connect(
+            self._on_player_position_changed)
         self.player.duration_changed.connect(self._on_player_duration_changed)
         self.player.signal_player_song_changed.connect(
             self._on_player_song_changed)
@@ -74,6 +90,9 @@ class App(FFrame):
         status_panel.theme_switch_btn.clicked.connect(
             self.refresh_themes)
 
+        self.plugins_manager.all_plugins_loaded.connect(
+            self._on_plugins_loaded)
+
         self.request.connected_signal.connect(self._on_network_connected)
         self.request.disconnected_signal.connect(self._on_network_disconnected)
         self.request.slow_signal.connect(self._on_network_slow)
@@ -105,14 +124,32 @@ class App(FFrame):
             painter.drawPixmap(0, 0, pixmap)
             painter.fillRect(self.rect(), bg_color)
 
+        if not self._painted:
+            self._painted = True
+            logger.info('startup: first paint in %.1fms'
+                        % ((time.perf_counter() - self._init_ts) * 1000))
+            # plugins are slow to load, show the window first
+            self.plugins_manager.load_later()
+
     def _init_managers(self):
         self.plugins_manager.scan()
         self.server.run()
+        self.bandwidth_scheduler.start()
+        self.theme_manager.preload()
         app_event_loop = asyncio.get_event_loop()
         app_event_loop.call_later(
             8, partial(asyncio.Task, self.version_manager.check_release()))
         self.tips_manager.show_random_tip()
 
+    def _on_plugins_loaded(self):
+        # songs of a source can only be restored when its plugin is loaded,
+        # and user may have started playing before that
+        if self.player.songs:
+            return
+        self.queue_store.restore()
+        if self.player.current_song is not None:
+            self._on_player_song_changed(self.player.current_song)
+
     def set_theme_style(self):
         theme = self.theme_manager.current_theme
         style_str = '''
@@ -123,7 +160,7 @@ class App(FFrame):
         '''.format(self.objectName(),
                    theme.background.name(),
                    theme.foreground.name())
-        self.setStyleSheet(style_str)
+        self.theme_manager.add_style(self, style_str)
 
     def message(self, text, error=False):
         self.ui.status_panel.message_label.show_message(text, error)
@@ -213,7 +250,27 @@ class App(FFrame):
     def show_request_progress(self, progress):
         self.ui.status_panel.network_status_label.show_progress(progress)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.position_broadcaster.acquire(self)
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.position_broadcaster.release(self)
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.WindowStateChange:
+            # progress widgets are not visible when window is minimized
+            if self.isMinimized():
+                self.position_broadcaster.release(self)
+            else:
+                self.position_broadcaster.acquire(self)
+
     def closeEvent(self, event):
+        self.server.stop()
+        self.queue_store.close()
+        self.play_history.close()
         try:
             self.player.quit()
         except Exception as e:
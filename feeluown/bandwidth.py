@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import threading
+import time
+
+from .config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """thread safe token bucket, one token is one byte
+
+    :param rate: tokens added per second, 0 means unlimited
+    """
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._tokens = rate
+        self._last_ts = time.monotonic()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._rate = rate
+            self._tokens = min(self._tokens, rate)
+
+    def consume(self, size):
+        """take ``size`` tokens, block until they are available"""
+        while True:
+            with self._lock:
+                if not self._rate:
+                    return
+                now = time.monotonic()
+                # capacity is one second of tokens, so a burst is bounded
+                self._tokens = min(
+                    self._rate,
+                    self._tokens + (now - self._last_ts) * self._rate)
+                self._last_ts = now
+                if self._tokens >= min(size, self._rate):
+                    self._tokens -= size
+                    return
+                wait = (min(size, self._rate) - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class BandwidthScheduler(object):
+    """throttle background downloads so that they yield to playback
+
+    Download threads call :meth:`throttle` for each chunk they receive.
+    Chunks are rate limited by a token bucket, and the threads are blocked
+    while the player buffer is at risk.
+    """
+    CHECK_INTERVAL = 1
+
+    def __init__(self, app):
+        super().__init__()
+        self._app = app
+
+        self._bucket = TokenBucket(config.download_rate_limit)
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._rate = 0
+        self._last_check_ts = time.monotonic()
+
+    @property
+    def limit(self):
+        """download rate limit in bytes per second, 0 means unlimited"""
+        return self._bucket.rate
+
+    def set_limit(self, limit):
+        self._bucket.set_rate(limit)
+        logger.info('set download rate limit to %d B/s' % limit)
+
+    @property
+    def rate(self):
+        """download rate measured in the last check interval"""
+        return self._rate
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    def status(self):
+        return {
+            'limit': self.limit,
+            'rate': self.rate,
+            'paused': self.paused,
+        }
+
+    def throttle(self, size):
+        """wait until ``size`` bytes are allowed to be downloaded
+
+        It is blocking and should be called in download threads.
+        """
+        self._resume_event.wait()
+        self._bucket.consume(size)
+        with self._lock:
+            self._bytes += size
+
+    def start(self):
+        event_loop = asyncio.get_event_loop()
+        event_loop.call_later(self.CHECK_INTERVAL, self._check)
+
+    def _check(self):
+        now = time.monotonic()
+        with self._lock:
+            self._rate = int(self._bytes / (now - self._last_check_ts))
+            self._bytes = 0
+        self._last_check_ts = now
+
+        if self._app.player.is_buffer_at_risk():
+            if not self.paused:
+                logger.info('player buffer is at risk, pause downloads')
+                self._resume_event.clear()
+        elif self.paused:
+            logger.info('player buffer is fine, resume downloads')
+            self._resume_event.set()
+
+        event_loop = asyncio.get_event_loop()
+        event_loop.call_later(self.CHECK_INTERVAL, self._check)
@@ -3,6 +3,20 @@
 
 class Config(object):
     debug = False
+    download_workers = 2
+    # split one song into several concurrent range requests when > 1
+    download_segments = 1
+    # bytes per second, 0 means unlimited
+    download_rate_limit = 0
+    # random mode avoids playing songs of same artist back-to-back
+    shuffle_anti_clustering = False
+    # ms between two position updates of progress widgets
+    position_update_interval = 500
+    # control server, it also listens on a unix socket if possible
+    server_host = '127.0.0.1'
+    server_port = 8000
+    # seconds between two event writes to one subscriber
+    server_event_interval = 0.1
 
 
 config = Config()
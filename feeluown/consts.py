@@ -16,9 +16,13 @@ DATA_DIR = HOME_DIR + '/data'
 USER_PLUGINS_DIR = HOME_DIR + '/plugins'
 USER_THEMES_DIR = HOME_DIR + '/themes'
 CACHE_DIR = HOME_DIR + '/cache'
+LYRICS_DIR = CACHE_DIR + '/lyrics'
 SONG_DIR = HOME_DIR + '/songs'
 
 LOG_FILE = HOME_DIR + '/run.log'
+QUEUE_FILE = DATA_DIR + '/queue.journal'
+HISTORY_DB_FILE = DATA_DIR + '/history.db'
+SOCKET_FILE = HOME_DIR + '/feeluown.sock'
 
 
 class PlaybackMode(Enum):
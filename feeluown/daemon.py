@@ -1 +1,115 @@
 # -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import signal
+import sys
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+from .bandwidth import BandwidthScheduler
+from .history import PlayHistory
+from .lyric import LyricManager
+from .player import Player
+from .player_mode import PlayerModeManager
+from .plugin import PluginsManager
+from .position import PositionBroadcaster
+from .queue_store import QueueStore
+from .request import Request
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+
+class Daemon(QObject):
+    """FeelUOwn without gui, it is driven by the control server
+
+    It has the same managers as :class:`feeluown.app.App` except the ones
+    for widgets, so that player, plugins and server work as usual. Plugins
+    are enabled by their ``enable_headless``.
+    """
+    headless = True
+
+    def __init__(self):
+        super().__init__()
+        self._init_ts = time.perf_counter()
+        self.player = Player(self)
+        self.player_mode_manager = PlayerModeManager(self)
+        self.position_broadcaster = PositionBroadcaster(self)
+        self.lyric_manager = LyricManager(self)
+        self.queue_store = QueueStore(self)
+        self.play_history = PlayHistory(self)
+        self.request = Request(self)
+        self.bandwidth_scheduler = BandwidthScheduler(self)
+        self.server = Server(self)
+        self.plugins_manager = PluginsManager(self)
+
+        self.plugins_manager.all_plugins_loaded.connect(
+            self._on_plugins_loaded)
+
+    def message(self, text, error=False):
+        if error:
+            logger.error(text)
+        else:
+            logger.info(text)
+
+    def notify(self, text, error=False):
+        pass
+
+    def start(self):
+        self.plugins_manager.scan()
+        self.server.run()
+        self.bandwidth_scheduler.start()
+        self.plugins_manager.load_later()
+
+    def _on_plugins_loaded(self):
+        if not self.player.songs:
+            self.queue_store.restore()
+        logger.info('startup: daemon ready in %.1fms'
+                    % ((time.perf_counter() - self._init_ts) * 1000))
+
+    def shutdown(self):
+        self.server.stop()
+        self.queue_store.close()
+        self.play_history.close()
+        try:
+            self.player.quit()
+        except Exception:
+            pass
+
+
+def main():
+    # parse args, create dirs and set plugin paths as gui does
+    from feeluown.__main__ import parse_args
+    from PyQt5.QtCore import QCoreApplication
+    from quamash import QEventLoop
+
+    parse_args(sys.argv)
+
+    q_app = QCoreApplication(sys.argv)
+    q_app.setApplicationName('FeelUOwn')
+
+    app_event_loop = QEventLoop(q_app)
+    asyncio.set_event_loop(app_event_loop)
+    daemon = Daemon()
+    daemon.start()
+
+    def quit(*args):
+        logger.info('daemon is quitting')
+        daemon.shutdown()
+        app_event_loop.stop()
+
+    signal.signal(signal.SIGINT, quit)
+    signal.signal(signal.SIGTERM, quit)
+    # python signal handlers only run when interpreter gets control
+    timer = QTimer()
+    timer.timeout.connect(lambda: None)
+    timer.start(500)
+
+    app_event_loop.run_forever()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,65 @@
 # -*- coding: utf-8 -*-
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import sqlite3
+
+
+logger = logging.getLogger(__name__)
+
+
+class Database(object):
+    """sqlite database which is only accessed in its own worker thread
+
+    Queries are submitted with :meth:`run`, so a slow disk never blocks
+    the caller. ``func`` receives the connection as its first argument::
+
+        def count(conn):
+            return conn.execute('select count(*) from t').fetchone()[0]
+
+        number = yield from db.run(count)
+    """
+    def __init__(self, path, init_sql=None):
+        self.path = path
+        self._init_sql = init_sql
+        self._conn = None
+        self._executor = ThreadPoolExecutor(1)
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            if self._init_sql is not None:
+                self._conn.executescript(self._init_sql)
+                self._conn.commit()
+        return self._conn
+
+    def _call(self, func, *args):
+        conn = self._connection()
+        try:
+            result = func(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+
+    def submit(self, func, *args):
+        """run ``func`` in worker thread, return a concurrent future"""
+        return self._executor.submit(self._call, func, *args)
+
+    def run(self, func, *args):
+        """run ``func`` in worker thread, return an asyncio future"""
+        return asyncio.wrap_future(self.submit(func, *args))
+
+    def run_sync(self, func, *args):
+        return self.submit(func, *args).result()
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+
+from PyQt5.QtMultimedia import QMediaPlayer
+
+from .consts import HISTORY_DB_FILE
+from .db import Database
+
+
+logger = logging.getLogger(__name__)
+
+
+# events is the append-only log, songs and artists are aggregates which
+# are updated in the same transaction, so that frequent queries never
+# scan the whole log
+INIT_SQL = '''
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    mid TEXT NOT NULL,
+    ts REAL NOT NULL,
+    listened INTEGER NOT NULL,
+    skipped INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts, skipped, source, mid);
+CREATE TABLE IF NOT EXISTS songs (
+    source TEXT NOT NULL,
+    mid TEXT NOT NULL,
+    title TEXT NOT NULL,
+    artists_name TEXT NOT NULL,
+    album_name TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    play_count INTEGER NOT NULL DEFAULT 0,
+    skip_count INTEGER NOT NULL DEFAULT 0,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (source, mid)
+);
+CREATE INDEX IF NOT EXISTS songs_last_ts ON songs (last_ts);
+CREATE INDEX IF NOT EXISTS songs_play_count ON songs (play_count);
+CREATE TABLE IF NOT EXISTS artists (
+    name TEXT PRIMARY KEY,
+    play_count INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+SONG_COLUMNS = 'source, mid, title, artists_name, album_name, length'
+
+
+def _add_event(conn, song, ts, listened, skipped):
+    source, mid, title, artists_name, album_name, length = song
+    conn.execute(
+        'INSERT INTO events (source, mid, ts, listened, skipped) '
+        'VALUES (?, ?, ?, ?, ?)', (source, mid, ts, listened, skipped))
+    played, skip = (0, 1) if skipped else (1, 0)
+    cursor = conn.execute(
+        'UPDATE songs SET title=?, artists_name=?, album_name=?, length=?, '
+        'play_count=play_count+?, skip_count=skip_count+?, last_ts=? '
+        'WHERE source=? AND mid=?',
+        (title, artists_name, album_name, length, played, skip, ts,
+         source, mid))
+    if not cursor.rowcount:
+        conn.execute(
+            'INSERT INTO songs (' + SONG_COLUMNS + ', play_count, '
+            'skip_count, last_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            song + (played, skip, ts))
+    if played:
+        for name in filter(None, artists_name.split(', ')):
+            conn.execute('INSERT OR IGNORE INTO artists (name) VALUES (?)',
+                         (name, ))
+            conn.execute('UPDATE artists SET play_count=play_count+1 '
+                         'WHERE name=?', (name, ))
+
+
+def _recent(conn, limit):
+    return conn.execute(
+        'SELECT ' + SONG_COLUMNS + ', play_count FROM songs '
+        'ORDER BY last_ts DESC LIMIT ?', (limit, )).fetchall()
+
+
+def _most_played(conn, since, limit):
+    if since is not None:
+        oldest = conn.execute('SELECT MIN(ts) FROM events').fetchone()[0]
+        if oldest is None or since <= oldest:
+            since = None
+    if since is None:
+        # window covers all history, the aggregate is enough
+        return conn.execute(
+            'SELECT ' + SONG_COLUMNS + ', play_count FROM songs '
+            'ORDER BY play_count DESC LIMIT ?', (limit, )).fetchall()
+    return conn.execute(
+        'SELECT s.source, s.mid, s.title, s.artists_name, s.album_name, '
+        's.length, e.count FROM ('
+        '  SELECT source, mid, COUNT(*) AS count FROM events'
+        '  WHERE ts >= ? AND skipped = 0 GROUP BY source, mid'
+        '  ORDER BY count DESC LIMIT ?) AS e '
+        'JOIN songs AS s ON s.source = e.source AND s.mid = e.mid '
+        'ORDER BY e.count DESC', (since, limit)).fetchall()
+
+
+def _artist_counts(conn, limit):
+    return conn.execute(
+        'SELECT name, play_count FROM artists '
+        'ORDER BY play_count DESC LIMIT ?', (limit, )).fetchall()
+
+
+def _song_counts(conn, source):
+    rows = conn.execute(
+        'SELECT mid, play_count, skip_count FROM songs WHERE source=?',
+        (source, ))
+    return {mid: (play_count, skip_count)
+            for mid, play_count, skip_count in rows}
+
+
+class PlayHistory(object):
+    """listening history of songs played by player
+
+    One event is logged when a song stops being the current song, with
+    the time actually listened. A song is regarded as skipped when less
+    than ``SKIP_RATIO`` of it is listened. Writes run in database thread.
+
+    Query methods are coroutines, rows are tuples of
+    ``(source, mid, title, artists_name, album_name, length, count)``.
+    Song ids are stored as text, since sources use different id types.
+    """
+    MIN_LISTENED = 1    # seconds, shorter plays are not logged
+    SKIP_RATIO = 0.5
+
+    def __init__(self, app, path=HISTORY_DB_FILE):
+        self._app = app
+        self._db = Database(path, INIT_SQL)
+
+        self._song = None
+        self._listened = 0
+        self._playing_since = None
+
+        self._app.player.signal_player_song_changed.connect(
+            self.on_song_changed)
+        self._app.player.stateChanged.connect(self.on_state_changed)
+
+    def on_song_changed(self, song):
+        self._finish()
+        self._song = song
+        self._listened = 0
+        self._playing_since = time.monotonic()
+
+    def on_state_changed(self, state):
+        if state == QMediaPlayer.PlayingState:
+            if self._playing_since is None:
+                self._playing_since = time.monotonic()
+        elif self._playing_since is not None:
+            self._listened += time.monotonic() - self._playing_since
+            self._playing_since = None
+
+    def _finish(self):
+        song = self._song
+        if song is None:
+            return
+        listened = self._listened
+        if self._playing_since is not None:
+            listened += time.monotonic() - self._playing_since
+        self._song = None
+        if listened < self.MIN_LISTENED:
+            return
+        listened = int(listened * 1000)
+        skipped = int(listened < (song.length or 0) * self.SKIP_RATIO)
+        record = (song.source, str(song.mid), song.title, song.artists_name,
+                  song.album_name, song.length or 0)
+        future = self._db.submit(_add_event, record, time.time(), listened,
+                                 skipped)
+        future.add_done_callback(self._on_event_added)
+
+    def _on_event_added(self, future):
+        if future.exception() is not None:
+            logger.error('add play event failed: %s' % future.exception())
+
+    @asyncio.coroutine
+    def recent(self, limit=50):
+        """recently played songs, each song appears once"""
+        return (yield from self._db.run(_recent, limit))
+
+    @asyncio.coroutine
+    def most_played(self, since=None, limit=50):
+        """
+        :param since: timestamp, count plays after it, None means all time
+        """
+        return (yield from self._db.run(_most_played, since, limit))
+
+    @asyncio.coroutine
+    def artist_counts(self, limit=50):
+        """list of ``(artist name, play count)``"""
+        return (yield from self._db.run(_artist_counts, limit))
+
+    @asyncio.coroutine
+    def song_counts(self, source):
+        """``{mid: (play count, skip count)}`` of songs of a source"""
+        return (yield from self._db.run(_song_counts, source))
+
+    def close(self):
+        self._finish()
+        self._db.close()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from bisect import bisect_right
+from collections import OrderedDict
+import json
+import logging
+import os
+import re
+import time
+
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer
+from fuocore.core.player import State
+
+from .consts import LYRICS_DIR
+
+
+logger = logging.getLogger(__name__)
+
+
+TIME_TAG_RE = re.compile(r'\[(\d+):(\d+)(?:[.:](\d+))?\]')
+OFFSET_RE = re.compile(r'\[offset:\s*([+-]?\d+)\]', re.IGNORECASE)
+
+
+def parse_lrc(text):
+    """parse lrc text into a list of ``(ms, line)`` sorted by time
+
+    A line can have several time tags, tags without time such as
+    ``[ar:...]`` are ignored.
+    """
+    if not text:
+        return []
+    offset = 0
+    match = OFFSET_RE.search(text)
+    if match is not None:
+        offset = int(match.group(1))
+    items = []
+    for raw_line in text.splitlines():
+        pos = 0
+        times = []
+        while True:
+            match = TIME_TAG_RE.match(raw_line, pos)
+            if match is None:
+                break
+            minute, second, fraction = match.groups()
+            ms = (int(minute) * 60 + int(second)) * 1000
+            if fraction:
+                # .x is 1/10 second, .xx is 1/100 second and so on
+                ms += int(fraction.ljust(3, '0')[:3])
+            times.append(max(ms - offset, 0))
+            pos = match.end()
+        if times:
+            line = raw_line[pos:].strip()
+            items.extend((ms, line) for ms in times)
+    items.sort(key=lambda item: item[0])
+    return items
+
+
+class Lyric(object):
+    """timeline of a lyric, lookups by position are binary searches
+
+    :param lrc: lrc text
+    :param tlrc: lrc text of translation, its lines are matched to lyric
+        lines by time
+    """
+    def __init__(self, lrc, tlrc=None):
+        items = parse_lrc(lrc)
+        self.times = [ms for ms, _ in items]
+        self.lines = [line for _, line in items]
+        translations = dict(parse_lrc(tlrc))
+        self.translations = [translations.get(ms, '') for ms in self.times]
+
+    def __len__(self):
+        return len(self.times)
+
+    def index_at(self, ms, hint=None):
+        """index of the line shown at ms, -1 if no line is started yet
+
+        :param hint: index of last lookup, it is checked first since
+            position usually moves forward a little
+        """
+        times = self.times
+        if hint is not None and 0 <= hint < len(times) and \
+                times[hint] <= ms and \
+                (hint + 1 == len(times) or ms < times[hint + 1]):
+            return hint
+        return bisect_right(times, ms) - 1
+
+    def next_time(self, index):
+        """start time of the line after index, None if it is the last"""
+        if index + 1 < len(self.times):
+            return self.times[index + 1]
+        return None
+
+
+class LyricManager(QObject):
+    """load lyric of current song and follow player position
+
+    Sources register a blocking fetch function which returns
+    ``{'lrc': text, 'tlrc': text}`` or None. Raw lyrics are cached in
+    ``LYRICS_DIR`` and parsed ones in memory. Lyrics of the songs to be
+    played next are prefetched.
+
+    Current line is not computed on every position tick: a single shot
+    timer fires when next line starts, it is rescheduled when player
+    state changes or position jumps.
+    """
+    line_changed = pyqtSignal([str, str])     # line, translation
+    lyric_changed = pyqtSignal()
+
+    MAX_PARSED = 20
+    PREFETCH = 2
+    RETRY_INTERVAL = 60     # seconds, a failed fetch is not retried before
+
+    def __init__(self, app, cache_dir=LYRICS_DIR):
+        super().__init__(app)
+        self._app = app
+        self._cache_dir = cache_dir
+        self._fetchers = {}     # source -> fetch function
+        self._parsed = OrderedDict()    # (source, mid) -> Lyric or None
+        self._loading = {}  # (source, mid) -> future
+        self._failed = {}   # (source, mid) -> time of last failed fetch
+
+        self.song = None
+        self.lyric = None
+        self.index = -1
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.sync)
+
+        player = self._app.player
+        player.signal_player_song_changed.connect(self.on_song_changed)
+        player.stateChanged.connect(self.sync)
+        self._app.position_broadcaster.position_changed.connect(self.sync)
+
+    def register(self, source, fetch):
+        self._fetchers[source] = fetch
+
+    def _cache_path(self, key):
+        return os.path.join(self._cache_dir, '%s_%s.json' % key)
+
+    def _load(self, song):
+        '''blocking, return raw lyric from disk cache or source'''
+        key = (song.source, song.mid)
+        path = self._cache_path(key)
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        fetch = self._fetchers.get(song.source)
+        if fetch is None:
+            return None
+        data = fetch(song)
+        if data is not None:
+            if not os.path.exists(self._cache_dir):
+                os.makedirs(self._cache_dir)
+            with open(path, 'w') as f:
+                json.dump(data, f)
+        return data
+
+    def _parse(self, data):
+        if not data or not data.get('lrc'):
+            return None
+        lyric = Lyric(data['lrc'], data.get('tlrc'))
+        return lyric if len(lyric) else None
+
+    def _load_and_parse(self, song):
+        '''blocking, raise LookupError if source returns nothing'''
+        data = self._load(song)
+        if data is None:
+            raise LookupError('source returns no lyric data')
+        return self._parse(data)
+
+    @asyncio.coroutine
+    def get(self, song):
+        """return parsed lyric of song, None if it has no lyric"""
+        key = (song.source, song.mid)
+        if key in self._parsed:
+            self._parsed.move_to_end(key)
+            return self._parsed[key]
+        if song.source not in self._fetchers:
+            return None
+        failed_at = self._failed.get(key)
+        if failed_at is not None and \
+                time.monotonic() - failed_at < self.RETRY_INTERVAL:
+            return None
+        future = self._loading.get(key)
+        if future is None:
+            event_loop = asyncio.get_event_loop()
+            future = event_loop.run_in_executor(
+                None, self._load_and_parse, song)
+            self._loading[key] = future
+        try:
+            lyric = yield from asyncio.shield(future)
+        except Exception as e:
+            # it is not cached, so it is fetched again later
+            logger.warning('load lyric of %s failed: %s' % (song.title, e))
+            now = time.monotonic()
+            self._failed = {k: t for k, t in self._failed.items()
+                            if now - t < self.RETRY_INTERVAL}
+            self._failed[key] = now
+            return None
+        finally:
+            self._loading.pop(key, None)
+        self._failed.pop(key, None)
+        self._parsed[key] = lyric
+        while len(self._parsed) > self.MAX_PARSED:
+            self._parsed.popitem(last=False)
+        return lyric
+
+    def on_song_changed(self, song):
+        self.song = song
+        self._set_lyric(None)
+        asyncio.Task(self._load_current(song))
+        for next_song in self._next_songs():
+            asyncio.Task(self.get(next_song))
+
+    def _next_songs(self):
+        player = self._app.player
+        songs = []
+        next_song = player._peek_next_song()
+        if next_song is not None:
+            songs.append(next_song)
+        if player.current_song in player.songs:
+            index = player.songs.index(player.current_song)
+            for song in player.songs[index + 1:index + 1 + self.PREFETCH]:
+                if next_song is None or song.mid != next_song.mid:
+                    songs.append(song)
+        return songs
+
+    @asyncio.coroutine
+    def _load_current(self, song):
+        lyric = yield from self.get(song)
+        if song is self.song:
+            self._set_lyric(lyric)
+
+    def _set_lyric(self, lyric):
+        self.lyric = lyric
+        self.index = -1
+        self._timer.stop()
+        self.lyric_changed.emit()
+        self.sync()
+
+    def current_line(self):
+        if self.lyric is None or self.index < 0:
+            return '', ''
+        return (self.lyric.lines[self.index],
+                self.lyric.translations[self.index])
+
+    def sync(self, *args):
+        """update current line and schedule the next update"""
+        self._timer.stop()
+        if self.lyric is None:
+            return
+        ms = self._app.player.position_ms
+        index = self.lyric.index_at(ms, self.index)
+        if index != self.index:
+            self.index = index
+            self.line_changed.emit(*self.current_line())
+        if self._app.player.player.state != State.playing:
+            return
+        next_ms = self.lyric.next_time(index)
+        if next_ms is not None:
+            self._timer.start(max(next_ms - ms, 0) + 10)
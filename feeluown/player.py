@@ -1,17 +1,19 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+from functools import partial
 import locale
 import logging
-import random
 
 from PyQt5.QtMultimedia import QMediaPlayer
 from PyQt5.QtCore import pyqtSignal, QObject
 from fuocore.core.player import MpvPlayer
 from fuocore.core.player import State
 
+from .config import config
 from .model import SongModel
 from .consts import PlaybackMode
+from .shuffle import ShuffleOrder
 
 
 logger = logging.getLogger(__name__)
@@ -26,11 +28,14 @@ class Player(QObject):
 
     # override QMediaPlayer signal to compat with new player backend
     stateChanged = pyqtSignal([QMediaPlayer.State])
-    positionChanged = pyqtSignal([int])
     duration_changed = pyqtSignal([int])
 
     signal_song_required = pyqtSignal()
 
+    # internal signals, they are emitted in mpv event thread
+    _preload_required = pyqtSignal()
+    _song_finished = pyqtSignal()
+
     _music_list = list()    # 里面的对象是music_model
 # FIXME: _current_index is unneeded
     _current_index = None
@@ -59,7 +64,17 @@ class Player(QObject):
         self._retry_latency = 3
         self._music_error_maximum = 3
 
+        self.position_ms = 0
+        self._pending_seek = None   # (song, second) restored from last run
         self._media_stalled = False
+        self._min_cache_duration = 5  # seconds
+
+        self._preloaded_song = None     # next song appended to mpv playlist
+        self._shuffle = ShuffleOrder(config.shuffle_anti_clustering)
+        self._index_by_mid = {}     # mid -> index in music list
+        self._preload_required.connect(self._preload_next)
+        self._song_finished.connect(self._on_song_finished)
+        self._enable_gapless()
 
     def change_player_mode_to_normal(self):
         logger.debug('退出特殊的播放模式')
@@ -72,16 +87,139 @@ class Player(QObject):
         self._other_mode = True
         self._set_playback_mode(PlaybackMode.sequential)
 
+    def is_buffer_at_risk(self):
+        """whether the playing network stream is (nearly) starving
+
+        Background network users such as downloader should back off when
+        it returns True.
+        """
+        if self._music_error_times > 0:
+            return True
+        if self.player.state != State.playing:
+            return False
+        # fuocore does not expose cache state, so ask mpv itself
+        mpv = getattr(self.player, '_mpv', None)
+        if mpv is None:
+            return False
+        try:
+            if mpv.paused_for_cache:
+                return True
+            cache_duration = mpv.demuxer_cache_duration
+        except Exception:
+            return False
+        return cache_duration is not None and \
+            cache_duration < self._min_cache_duration
+
     def _record_playback_mode(self):
         self.last_playback_mode = self.playback_mode
 
     def on_media_changed(self):
         music_model = self._music_list[self._current_index]
         self.signal_player_song_changed.emit(music_model)
+        self._preload_required.emit()
 
     def on_song_finished(self):
         """listen to new player song_finished event"""
-        self.play_next()
+        # it is called in mpv event thread, peeking next song may change
+        # shuffle state, so handle it in main thread
+        self._song_finished.emit()
+
+    def _on_song_finished(self):
+        song = self._preloaded_song
+        if song is not None and song is self._peek_next_song():
+            # mpv has already started the preloaded song
+            self._preloaded_song = None
+            self._on_preloaded_song_started(song)
+        else:
+            self.play_next()
+
+    def _enable_gapless(self):
+        mpv = getattr(self.player, '_mpv', None)
+        if mpv is None:
+            return
+        try:
+            mpv['gapless-audio'] = 'yes'
+            mpv['prefetch-playlist'] = 'yes'
+        except Exception:
+            logger.warning('mpv does not support gapless options')
+
+    def _mpv_command(self, *args):
+        # fuocore does not expose mpv playlist, so talk to mpv itself
+        mpv = getattr(self.player, '_mpv', None)
+        if mpv is None:
+            return False
+        try:
+            mpv.command(*args)
+        except Exception:
+            logger.exception('mpv command %s failed' % (args, ))
+            return False
+        return True
+
+    def _peek_next_song(self):
+        """return the song which will be played next, without side effect"""
+        if self._tmp_fix_next_song is not None:
+            return self._tmp_fix_next_song
+        if not self._music_list or self._current_index is None:
+            return None
+        length = len(self._music_list)
+        if self.playback_mode == PlaybackMode.one_loop:
+            index = self._current_index
+        elif self.playback_mode == PlaybackMode.loop:
+            index = (self._current_index + 1) % length
+        elif self.playback_mode == PlaybackMode.sequential:
+            # as get_next_song_index, player mode decides what comes next
+            return None
+        else:
+            index = self._shuffle_index(self._shuffle.peek_next())
+            if index is None:
+                return None
+        if index == 0 and self._other_mode:
+            return None
+        return self._music_list[index]
+
+    def _invalidate_preload(self):
+        """next song may change, preload it again"""
+        if self.current_song is not None:
+            self._preload_required.emit()
+
+    def _preload_next(self):
+        if self._preloaded_song is not None:
+            self._preloaded_song = None
+            # remove every entry from mpv playlist except the current one
+            self._mpv_command('playlist-clear')
+        song = self._peek_next_song()
+        if song is None:
+            return
+        event_loop = asyncio.get_event_loop()
+        future = event_loop.run_in_executor(None, lambda: song.url)
+        future.add_done_callback(partial(self._on_next_url_resolved, song))
+
+    def _on_next_url_resolved(self, song, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.warning('resolve url of next song %s failed: %s'
+                           % (song.title, future.exception()))
+            return
+        url = future.result()
+        if url is None or self._preloaded_song is not None or \
+                song is not self._peek_next_song():
+            return
+        if self._mpv_command('loadfile', url, 'append'):
+            self._preloaded_song = song
+            logger.debug('preload next song: %s' % song.title)
+
+    def _on_preloaded_song_started(self, song):
+        if song is self._tmp_fix_next_song:
+            self._tmp_fix_next_song = None
+            self._app.player_mode_manager.exit_to_normal()
+            self.insert_to_next(song)
+        self._shuffle.set_current(song.mid)
+        self._current_index = self.get_index_by_model(song)
+        self.current_song = song
+        self._app.queue_store.update_state()
+        self.signal_player_song_changed.emit(song)
+        self._preload_next()
 
     def on_state_changed(self, *args, **kwargs):
         if self.player.state == State.playing:
@@ -92,9 +230,17 @@ class Player(QObject):
             self.stateChanged.emit(QMediaPlayer.StoppedState)
 
     def on_position_changed(self, *args, **kwargs):
-        self.positionChanged.emit(self.player.position * 1000)
+        # it is called in mpv event thread at a high rate, so only record
+        # the value, PositionBroadcaster delivers it at a limited rate
+        self.position_ms = int(self.player.position * 1000)
 
     def on_duration_changed(self, *args, **kwags):
+        if self._pending_seek is not None:
+            song, second = self._pending_seek
+            self._pending_seek = None
+            # media is loaded once duration is known, so it can be seeked
+            if song is self.current_song:
+                self.player.position = second
         self.duration_changed.emit(self.player.duration * 1000)
 
     def insert_to_next(self, model):
@@ -104,48 +250,61 @@ class Player(QObject):
             else:
                 index = self._current_index + 1
             self._music_list.insert(index, model)
+            self._reindex(index)
+            self._shuffle.insert_next(model.mid, model.artists_name)
+            self._app.queue_store.insert(index, model)
+            self._invalidate_preload()
             return True
         return False
 
     def add_music(self, song):
         self._music_list.append(song)
+        self._index_by_mid[song.mid] = len(self._music_list) - 1
+        self._shuffle.add(song.mid, song.artists_name)
+        self._app.queue_store.append(song)
+        self._invalidate_preload()
 
     def remove_music(self, mid):
-        for i, music_model in enumerate(self._music_list):
-            if mid == music_model.mid:
-                self._music_list.pop(i)
-                if self._current_index is None:
-                    return True
-                if i == self._current_index:
-                    self._current_index = self.get_next_song_index()
-                    if self._current_index is None:
-                        self.current_song = None
-                    else:
-                        self.current_song = \
-                            self._music_list[self._current_index]
-                    self.stop()
-                elif i < self._current_index:
-                    self._current_index -= 1
-                return True
-        return False
+        i = self._index_by_mid.pop(mid, None)
+        if i is None:
+            return False
+        self._music_list.pop(i)
+        self._reindex(i)
+        self._shuffle.remove(mid)
+        self._app.queue_store.remove(mid)
+        if self._current_index is None:
+            return True
+        if i == self._current_index:
+            self._current_index = self.get_next_song_index()
+            if self._current_index is None:
+                self.current_song = None
+            else:
+                self.current_song = self._music_list[self._current_index]
+            self.stop()
+        elif i < self._current_index:
+            self._current_index -= 1
+        self._invalidate_preload()
+        return True
 
     def set_music_list(self, music_list):
         self._music_list = []
         self._music_list = music_list
+        self._reset_shuffle()
+        self._app.queue_store.reset(self._music_list)
         if len(self._music_list):
             self.play(self._music_list[0])
 
     def clear_playlist(self):
         self._music_list = []
+        self._reset_shuffle()
+        self._app.queue_store.reset(self._music_list)
         self._current_index = None
         self.current_song = None
+        self._preloaded_song = None
         self.stop()
 
     def is_music_in_list(self, model):
-        for music in self._music_list:
-            if model.mid == music.mid:
-                return True
-        return False
+        return model.mid in self._index_by_mid
 
     def _play(self, music_model):
         insert_flag = self.insert_to_next(music_model)
@@ -157,6 +316,10 @@ class Player(QObject):
 
         self._current_index = index
         self.current_song = music_model
+        self._shuffle.set_current(music_model.mid)
+        self._app.queue_store.update_state()
+        # mpv playlist is replaced, the preloaded song is dropped
+        self._preloaded_song = None
         self.player.play(self.current_song.url)
 
     def other_mode_play(self, music_model):
@@ -181,11 +344,24 @@ class Player(QObject):
     def setVolume(self, volume):
         self.player.volume = volume
 
+    def _reset_shuffle(self):
+        self._index_by_mid = {}
+        self._reindex()
+        self._shuffle.reset((song.mid, song.artists_name)
+                            for song in self._music_list)
+
+    def _reindex(self, start=0):
+        '''update index of songs from start, after list is changed there'''
+        for i in range(start, len(self._music_list)):
+            self._index_by_mid[self._music_list[i].mid] = i
+
+    def _shuffle_index(self, mid):
+        if mid is None:
+            return None
+        return self._index_by_mid.get(mid)
+
     def get_index_by_model(self, music_model):
-        for i, music in enumerate(self._music_list):
-            if music_model.mid == music.mid:
-                return i
-        return None
+        return self._index_by_mid.get(music_model.mid)
 
     def play_or_pause(self):
         if len(self._music_list) is 0:
@@ -195,9 +371,9 @@ class Player(QObject):
             self.player.pause()
         elif self.player.state == State.paused:
             self.player.resume()
-        else:
-            # TODO: when player is stopped state, play next song
-            pass
+        elif self.current_song is not None:
+            # e.g. the queue is restored from last run
+            self._play(self.current_song)
 
     def play_next(self):
         if self._tmp_fix_next_song is not None:
@@ -229,6 +405,7 @@ class Player(QObject):
 
     def set_tmp_fixed_next_song(self, song):
         self._tmp_fix_next_song = song
+        self._invalidate_preload()
 
     def _wait_to_retry(self):
         if self._music_error_times >= self._music_error_maximum:
@@ -262,7 +439,7 @@ class Player(QObject):
             self.signal_playlist_finished.emit()
             return None
         else:
-            return random.choice(range(len(self._music_list)))
+            return self._shuffle_index(self._shuffle.next())
 
     def get_previous_song_index(self):
         if len(self._music_list) is 0:
@@ -277,7 +454,24 @@ class Player(QObject):
         elif self.playback_mode == PlaybackMode.sequential:
             return None
         else:
-            return random.choice(range(len(self._music_list)))
+            index = self._shuffle_index(self._shuffle.previous())
+            if index is None:
+                return self._current_index
+            return index
+
+    def restore_queue(self, songs, index, mode, position=0):
+        """restore queue without playing, position is in ms"""
+        self._music_list = songs
+        self._reset_shuffle()
+        if mode != self.playback_mode:
+            self.playback_mode = mode
+            self.signal_playback_mode_changed.emit(mode)
+        if index is not None:
+            self._current_index = index
+            self.current_song = songs[index]
+            self._shuffle.set_current(self.current_song.mid)
+            if position:
+                self._pending_seek = (self.current_song, position / 1000)
 
     def _set_playback_mode(self, mode):
         # item once: 0
@@ -291,6 +485,8 @@ class Player(QObject):
         self.playback_mode = mode
         self._app.message('设置播放顺序为：%s' % mode.value)
         self.signal_playback_mode_changed.emit(mode)
+        self._app.queue_store.update_state()
+        self._invalidate_preload()
 
     def next_playback_mode(self):
         if self.playback_mode == PlaybackMode.one_loop:
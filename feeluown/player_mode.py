@@ -1,3 +1,5 @@
+import asyncio
+from collections import deque
 import logging
 
 logger = logging.getLogger(__name__)
@@ -55,3 +57,71 @@ class PlayerModeBase(object):
         self._app.message('退出 %s 播放模式' % self.name)
         self.player.signal_playlist_finished.disconnect(
             self.on_playlist_finished)
+
+
+class SongBuffer(object):
+    """songs waiting to be played by a player mode
+
+    ``fetch`` is a blocking function returning a list of songs, it runs in
+    executor whenever the buffer is below ``low_water``. The url of the
+    song at the head is resolved in advance, so that it can be played
+    without waiting for network.
+    """
+    def __init__(self, fetch, low_water=3):
+        self._fetch = fetch
+        self.low_water = low_water
+        self._songs = deque()
+        self._refilling = None
+        self._resolved_song = None
+
+    def __len__(self):
+        return len(self._songs)
+
+    def refill(self):
+        """start refilling if needed, return the refilling future"""
+        if self._refilling is None and len(self._songs) < self.low_water:
+            event_loop = asyncio.get_event_loop()
+            self._refilling = event_loop.run_in_executor(None, self._fetch)
+            self._refilling.add_done_callback(self._on_fetched)
+        return self._refilling
+
+    def _on_fetched(self, future):
+        self._refilling = None
+        try:
+            songs = future.result()
+        except Exception:
+            logger.exception('refill song buffer failed')
+            return
+        self._songs.extend(songs or [])
+        logger.debug('song buffer is refilled, %d songs' % len(self._songs))
+        self._resolve_head()
+
+    def _resolve_head(self):
+        if not self._songs or self._songs[0] is self._resolved_song:
+            return
+        song = self._resolved_song = self._songs[0]
+        event_loop = asyncio.get_event_loop()
+        # song model caches its url once it is resolved
+        event_loop.run_in_executor(None, lambda: song.url)
+
+    def pop(self):
+        """return next song, or None when buffer is empty"""
+        song = self._songs.popleft() if self._songs else None
+        self.refill()
+        self._resolve_head()
+        return song
+
+    @asyncio.coroutine
+    def get(self):
+        """like :meth:`pop`, but wait for refilling when buffer is empty"""
+        if not self._songs:
+            future = self.refill()
+            if future is not None:
+                try:
+                    yield from future
+                except Exception:
+                    pass    # it is logged in _on_fetched
+        return self.pop()
+
+    def clear(self):
+        self._songs.clear()
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import ast
+import asyncio
 import os
 import importlib
 import logging
+import time
+
+from PyQt5.QtCore import pyqtSignal, QObject
 
 from .consts import USER_PLUGINS_DIR, PLUGINS_DIR
 
@@ -11,12 +16,64 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-class PluginsManager(object):
+METADATA_NAMES = ('__alias__', '__version__', '__desc__',
+                  '__feeluown_version__')
+
+
+def read_metadata(plugin_dir):
+    """read metadata of a plugin from its ``__init__.py`` without import"""
+    metadata = {}
+    with open(os.path.join(plugin_dir, '__init__.py'), 'rb') as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+            continue
+        target = node.targets[0]
+        if isinstance(target, ast.Name) and target.id in METADATA_NAMES:
+            try:
+                metadata[target.id] = ast.literal_eval(node.value)
+            except ValueError:
+                pass
+    return metadata
+
+
+class PluginInfo(object):
+    def __init__(self, module_name, metadata):
+        self.module_name = module_name
+        self.name = metadata.get('__alias__', module_name)
+        self.version = metadata.get('__version__', '')
+        self.desc = metadata.get('__desc__', '')
+
+        self.module = None
+        self.import_time = None     # ms
+        self.enable_time = None     # ms
+        self.error = None
+
+    @property
+    def loaded(self):
+        return self.module is not None or self.error is not None
+
+
+class PluginsManager(QObject):
+    """load plugins after main window is painted
+
+    :meth:`scan` only reads plugin metadata. Plugins are imported and
+    enabled one by one in later event loop iterations, or at once when
+    one is requested by :meth:`get`. Import and enable time of every
+    plugin is recorded for the startup report.
+
+    In headless mode, ``enable_headless`` of a plugin is called instead
+    of ``enable``, plugins without it are not loaded.
+    """
+    all_plugins_loaded = pyqtSignal()
+
     def __init__(self, app):
         super().__init__()
         self._app = app
 
-        self._plugins = {}
+        self._plugins = {}  # name -> PluginInfo
+        self._pending = []
+        self._loading = False
 
     def load(self, plugin):
         plugin.enable(self._app)
@@ -25,16 +82,82 @@ class PluginsManager(object):
         plugin.disable(self._app)
 
     def scan(self):
-        modules_name = [p for p in os.listdir(PLUGINS_DIR)
-                        if os.path.isdir(os.path.join(PLUGINS_DIR, p))]
-        modules_name.extend([p for p in os.listdir(USER_PLUGINS_DIR)
-                             if os.path.isdir(os.path.join(USER_PLUGINS_DIR))])
-        for module_name in modules_name:
+        plugin_dirs = [os.path.join(PLUGINS_DIR, p)
+                       for p in os.listdir(PLUGINS_DIR)]
+        plugin_dirs.extend([os.path.join(USER_PLUGINS_DIR, p)
+                            for p in os.listdir(USER_PLUGINS_DIR)])
+        for plugin_dir in plugin_dirs:
+            if not os.path.isfile(os.path.join(plugin_dir, '__init__.py')):
+                continue
+            module_name = os.path.basename(plugin_dir)
             try:
-                module = importlib.import_module(module_name)
-                plugin_name = module.__alias__
-                self._plugins[plugin_name] = module
-                module.enable(self._app)
-                logger.info('detect plugin: %s.' % plugin_name)
-            except:
+                metadata = read_metadata(plugin_dir)
+            except (OSError, SyntaxError):
                 logger.exception('detect a bad plugin %s' % module_name)
+                continue
+            info = PluginInfo(module_name, metadata)
+            self._plugins[info.name] = info
+            self._pending.append(info)
+            logger.info('detect plugin: %s.' % info.name)
+
+    def load_later(self):
+        """load pending plugins, one plugin per event loop iteration"""
+        if self._loading:
+            return
+        self._loading = True
+        asyncio.get_event_loop().call_soon(self._load_next)
+
+    def _load_next(self):
+        while self._pending and self._pending[0].loaded:
+            self._pending.pop(0)
+        if not self._pending:
+            self._loading = False
+            self.log_report()
+            self.all_plugins_loaded.emit()
+            return
+        self._load_plugin(self._pending.pop(0))
+        asyncio.get_event_loop().call_soon(self._load_next)
+
+    def _load_plugin(self, info):
+        try:
+            start = time.perf_counter()
+            module = importlib.import_module(info.module_name)
+            info.import_time = (time.perf_counter() - start) * 1000
+            enable = module.enable
+            if getattr(self._app, 'headless', False):
+                enable = getattr(module, 'enable_headless', None)
+                if enable is None:
+                    raise RuntimeError('headless mode is not supported')
+            start = time.perf_counter()
+            enable(self._app)
+            info.enable_time = (time.perf_counter() - start) * 1000
+            info.module = module
+        except Exception as e:
+            info.error = e
+            logger.exception('load plugin %s failed' % info.name)
+
+    def get(self, name):
+        """return plugin module, load it now if it is not loaded yet"""
+        info = self._plugins.get(name)
+        if info is None:
+            return None
+        if not info.loaded:
+            self._load_plugin(info)
+        return info.module
+
+    def report(self):
+        return [{'name': info.name,
+                 'import_time': info.import_time,
+                 'enable_time': info.enable_time,
+                 'error': None if info.error is None else str(info.error)}
+                for info in self._plugins.values()]
+
+    def log_report(self):
+        for item in self.report():
+            if item['error'] is not None:
+                logger.info('plugin %s: failed, %s'
+                            % (item['name'], item['error']))
+            elif item['import_time'] is not None:
+                logger.info('plugin %s: import %.1fms, enable %.1fms'
+                            % (item['name'], item['import_time'],
+                               item['enable_time']))
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+__alias__ = '本地音乐'
+__feeluown_version__ = '1.1.1'
+__version__ = '0.0.1'
+__desc__ = '本地音乐'
+
+logger = logging.getLogger(__name__)
+
+_local_music = None
+
+
+def enable(app):
+    from .local import LocalMusic
+
+    global _local_music
+    _local_music = LocalMusic(app)
+    _local_music.scan()
+    logger.info('localmusic plugin enabled')
+
+
+def enable_headless(app):
+    # songs of the library are only needed to restore the queue
+    from .consts import SOURCE
+    from .model import LSongModel
+
+    app.queue_store.register(SOURCE, LSongModel.create_from_queue,
+                             LSongModel.to_queue_extra)
+    logger.info('localmusic plugin enabled in headless mode')
+
+
+def disable(app):
+    if _local_music is not None:
+        _local_music.library.close()
+    logger.info('localmusic plugin disabled')
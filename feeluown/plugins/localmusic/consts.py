@@ -0,0 +1,9 @@
+import os
+
+from feeluown.consts import DATA_DIR, SONG_DIR
+
+
+SOURCE = 'local'
+DB_FILE = DATA_DIR + '/local_music.db'
+MUSIC_DIRS = [SONG_DIR, os.path.expanduser('~') + '/Music']
+AUDIO_EXTS = ('.mp3', '.flac', '.ogg', '.m4a', '.wav', '.ape', '.wma')
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+
+from feeluown.db import Database
+
+from .consts import AUDIO_EXTS, DB_FILE, MUSIC_DIRS
+from .model import LSongModel
+
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+
+logger = logging.getLogger(__name__)
+
+
+INIT_SQL = '''
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    artists_name TEXT NOT NULL,
+    album_name TEXT NOT NULL,
+    length INTEGER NOT NULL
+);
+'''
+
+
+def walk(dirs):
+    """return ``{path: (mtime, size)}`` of audio files in dirs
+
+    Symlinks are followed, a directory is listed only once even if links
+    point to it, so links to a parent directory do not loop forever.
+    """
+    files = {}
+    visited = set()     # (st_dev, st_ino) of listed directories
+    stack = [d for d in dirs if os.path.isdir(d)]
+    while stack:
+        directory = stack.pop()
+        try:
+            stat = os.stat(directory)
+            key = (stat.st_dev, stat.st_ino)
+            if key in visited:
+                continue
+            visited.add(key)
+            entries = list(os.scandir(directory))
+        except OSError:
+            logger.warning('can not list %s' % directory)
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                stack.append(entry.path)
+            elif entry.name.lower().endswith(AUDIO_EXTS):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    # e.g. a broken symlink
+                    logger.warning('can not stat %s' % entry.path)
+                    continue
+                files[entry.path] = (stat.st_mtime, stat.st_size)
+    return files
+
+
+def _first_tag(tags, key, default):
+    values = tags.get(key) if tags is not None else None
+    if values:
+        return ', '.join(values)
+    return default
+
+
+def read_tags(path):
+    """read title, artists, album and length (ms) of an audio file"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    # files downloaded by neteasemusic plugin are named 'title - artists'
+    if ' - ' in name:
+        title, artists_name = name.split(' - ', 1)
+    else:
+        title, artists_name = name, ''
+    album_name = ''
+    length = 0
+    if mutagen is not None:
+        try:
+            audio = mutagen.File(path, easy=True)
+        except Exception:
+            audio = None
+        if audio is not None:
+            title = _first_tag(audio.tags, 'title', title)
+            artists_name = _first_tag(audio.tags, 'artist', artists_name)
+            album_name = _first_tag(audio.tags, 'album', album_name)
+            if audio.info is not None:
+                length = int(audio.info.length * 1000)
+    return title, artists_name, album_name, length
+
+
+def read_tags_batch(paths):
+    return [(path,) + read_tags(path) for path in paths]
+
+
+def _load_stats(conn):
+    rows = conn.execute('SELECT path, mtime, size FROM songs')
+    return {path: (mtime, size) for path, mtime, size in rows}
+
+
+def _update(conn, songs, deleted_paths):
+    for path, mtime, size, title, artists_name, album_name, length in songs:
+        # keep song id of a modified file, so it is still the same song
+        cursor = conn.execute(
+            'UPDATE songs SET mtime=?, size=?, title=?, artists_name=?, '
+            'album_name=?, length=? WHERE path=?',
+            (mtime, size, title, artists_name, album_name, length, path))
+        if not cursor.rowcount:
+            conn.execute(
+                'INSERT INTO songs (path, mtime, size, title, artists_name, '
+                'album_name, length) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (path, mtime, size, title, artists_name, album_name, length))
+    conn.executemany('DELETE FROM songs WHERE path=?',
+                     [(path,) for path in deleted_paths])
+
+
+def _list_songs(conn):
+    return conn.execute(
+        'SELECT id, path, title, artists_name, album_name, length '
+        'FROM songs ORDER BY artists_name, album_name, title').fetchall()
+
+
+def _search(conn, text):
+    pattern = '%' + text + '%'
+    return conn.execute(
+        'SELECT id, path, title, artists_name, album_name, length '
+        'FROM songs WHERE title LIKE ? OR artists_name LIKE ? '
+        'OR album_name LIKE ? ORDER BY artists_name, album_name, title',
+        (pattern, pattern, pattern)).fetchall()
+
+
+class Library(object):
+    """local music library with an incremental metadata cache
+
+    Tags are cached in sqlite together with file mtime and size, a rescan
+    only reads tags of new or modified files.
+    """
+    BATCH_SIZE = 200
+
+    def __init__(self, dirs=MUSIC_DIRS, db_path=DB_FILE):
+        self.dirs = dirs
+        self._db = Database(db_path, INIT_SQL)
+
+    @asyncio.coroutine
+    def scan(self):
+        """rescan dirs, return the number of added/modified/deleted files"""
+        event_loop = asyncio.get_event_loop()
+        files = yield from event_loop.run_in_executor(None, walk, self.dirs)
+        known = yield from self._db.run(_load_stats)
+        changed = [path for path, stat in files.items()
+                   if known.get(path) != stat]
+        deleted = [path for path in known if path not in files]
+        logger.info('scan local music: %d files, %d changed, %d deleted'
+                    % (len(files), len(changed), len(deleted)))
+
+        batches = [changed[i:i + self.BATCH_SIZE]
+                   for i in range(0, len(changed), self.BATCH_SIZE)]
+        # forking the qt process for a process pool is unsafe, tags are
+        # read in threads of default executor as other blocking jobs
+        futures = [event_loop.run_in_executor(None, read_tags_batch, batch)
+                   for batch in batches]
+        songs = []
+        for future in futures:
+            for path, *tags in (yield from future):
+                songs.append((path,) + files[path] + tuple(tags))
+        yield from self._db.run(_update, songs, deleted)
+        return len(changed), len(deleted)
+
+    @asyncio.coroutine
+    def list_songs(self):
+        rows = yield from self._db.run(_list_songs)
+        return [LSongModel(*row) for row in rows]
+
+    @asyncio.coroutine
+    def search(self, text):
+        rows = yield from self._db.run(_search, text)
+        return [LSongModel(*row) for row in rows]
+
+    def close(self):
+        self._db.close()
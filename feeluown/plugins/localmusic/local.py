@@ -0,0 +1,55 @@
+import asyncio
+import logging
+
+from PyQt5.QtCore import QObject
+
+from feeluown.widgets.components import LP_GroupItem, MusicTable
+
+from .consts import SOURCE
+from .library import Library
+from .model import LSongModel
+
+logger = logging.getLogger(__name__)
+
+
+class LocalMusic(QObject):
+
+    def __init__(self, app):
+        super().__init__(parent=app)
+        self._app = app
+
+        self.library = Library()
+        self.songs = []
+        self.songs_table = None
+
+        self.item = LP_GroupItem(self._app, '本地音乐')
+        self.item.set_img_text('♫')
+        library_panel = self._app.ui.central_panel.left_panel.library_panel
+        library_panel.add_item(self.item)
+
+        self.item.clicked.connect(self.show_songs)
+        self._app.queue_store.register(SOURCE, LSongModel.create_from_queue,
+                                       LSongModel.to_queue_extra)
+
+    def scan(self):
+        event_loop = asyncio.get_event_loop()
+        event_loop.create_task(self._scan())
+
+    @asyncio.coroutine
+    def _scan(self):
+        try:
+            changed, deleted = yield from self.library.scan()
+            self.songs = yield from self.library.list_songs()
+        except Exception:
+            logger.exception('scan local music failed')
+            self._app.message('扫描本地音乐失败', error=True)
+            return
+        if changed or deleted:
+            self._app.message('本地音乐扫描完毕，共 %d 首歌曲' % len(self.songs))
+
+    def show_songs(self):
+        if self.songs_table is None:
+            self.songs_table = MusicTable(self._app)
+            self.songs_table.play_song_signal.connect(self._app.player.play)
+        self.songs_table.set_songs(self.songs)
+        self._app.ui.central_panel.right_panel.set_widget(self.songs_table)
@@ -0,0 +1,62 @@
+from feeluown.model import SongModel
+
+from .consts import SOURCE
+
+
+MID_PREFIX = 'local-'
+
+
+class LSongModel(SongModel):
+    def __init__(self, mid, path, title, artists_name, album_name, length):
+        super().__init__()
+        self._mid = mid     # row id in library database
+        self._path = path
+        self._title = title
+        self._artists_name = artists_name
+        self._album_name = album_name
+        self._length = length
+
+    @property
+    def mid(self):
+        # player and queue match songs by mid only, row ids would collide
+        # with song ids of other sources
+        return MID_PREFIX + str(self._mid)
+
+    @property
+    def title(self):
+        return self._title
+
+    @property
+    def artists_name(self):
+        return self._artists_name
+
+    @property
+    def album_name(self):
+        return self._album_name
+
+    @property
+    def album_img(self):
+        return ''
+
+    @property
+    def url(self):
+        return self._path
+
+    @property
+    def length(self):
+        return self._length
+
+    @property
+    def source(self):
+        return SOURCE
+
+    def to_queue_extra(self):
+        return {'path': self._path}
+
+    @classmethod
+    def create_from_queue(cls, data):
+        mid = data['mid']
+        if isinstance(mid, str) and mid.startswith(MID_PREFIX):
+            mid = int(mid[len(MID_PREFIX):])
+        return cls(mid, data['path'], data['title'],
+                   data['artists_name'], data['album_name'], data['length'])
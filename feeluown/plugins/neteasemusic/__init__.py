@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import logging.config
 
-from .nem import Nem
 from .consts import LOG_FILE
 from feeluown.config import config
 
@@ -44,20 +44,35 @@ dict_config = {
     }
 }
 
-if config.debug:
-    logging.config.dictConfig(dict_config)
-else:
-    dict_config['loggers']['neteasemusic']['handlers'] = ['release']
-    logging.config.dictConfig(dict_config)
-
 logger = logging.getLogger(__name__)
 
 
+def config_logger():
+    # it opens log file, so it is not done at import time
+    if not config.debug:
+        dict_config['loggers']['neteasemusic']['handlers'] = ['release']
+    logging.config.dictConfig(dict_config)
+
+
 def enable(app):
+    # the plugin imports requests, qt widgets and so on, import it lazily
+    from .nem import Nem
+
+    config_logger()
     nem = Nem(app)
     nem.ready_to_login()
     logger.info('neteasemusic plugin enabled')
 
 
+def enable_headless(app):
+    # only models and api, no widgets
+    from .service import NemService
+
+    config_logger()
+    service = NemService(app)
+    service.login_last_user()
+    logger.info('neteasemusic plugin enabled in headless mode')
+
+
 def disable(app):
     logger.info('neteasemusic plugin disabled')
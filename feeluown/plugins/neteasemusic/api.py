@@ -17,10 +17,10 @@ import json
 import logging
 from difflib import SequenceMatcher
 
-from bs4 import BeautifulSoup
 import requests
-from Crypto.Cipher import AES
-from Crypto.PublicKey import RSA
+
+# bs4 and Crypto are slow to import and only needed by a few api, they are
+# imported when they are used
 
 
 site_uri = 'http://music.163.com'
@@ -241,6 +241,7 @@ class Api(object):
         res = self.http.get(action, data)
         if res is None:
             return None
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(res.content, 'html.parser')
         albdescs = soup.select('.n-albdesc')
         if albdescs:
@@ -253,6 +254,7 @@ class Api(object):
         res = self.http.get(action, data)
         if res is None:
             return None
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(res.content, 'html.parser')
         artdescs = soup.select('.n-artdesc')
         if artdescs:
@@ -278,27 +280,40 @@ class Api(object):
 
     def songs_detail(self, music_ids):
         music_ids = [str(music_id) for music_id in music_ids]
-        action = uri + '/api/song/detail?ids=[' +\
-            ','.join(music_ids) + ']'
+        action = uri + '/song/detail?ids=[' + ','.join(music_ids) + ']'
         data = self.request('GET', action)
         return data
 
-    def op_music_to_playlist(self, mid, pid, op):
+    def op_music_to_playlist(self, mids, pid, op):
         """
+        :param mids: one music id or a list of them, they are sent in
+            one request
         :param op: add or del
-        把mid这首音乐加入pid这个歌单列表当中去
+        把mids这些音乐加入pid这个歌单列表当中去
         1. 如果歌曲已经在列表当中，返回code为502
         """
+        if not isinstance(mids, (list, tuple)):
+            mids = [mids]
+        mids = [str(mid) for mid in mids]
         url_add = uri + '/playlist/manipulate/tracks'
-        trackIds = '["' + str(mid) + '"]'
         data_add = {
-            'tracks': str(mid),  # music id
+            'tracks': ','.join(mids),  # music ids
             'pid': str(pid),    # playlist id
-            'trackIds': trackIds,  # music id str
+            'trackIds': json.dumps(mids),  # music id str
             'op': op   # opation
         }
         return self.request('POST', url_add, data_add)
 
+    def update_playlist_order(self, pid, mids):
+        """set order of all songs of a playlist in one request"""
+        url = uri + '/song/order/update'
+        data = {
+            'pid': str(pid),
+            'trackIds': json.dumps([str(mid) for mid in mids]),
+            'op': 'update',
+        }
+        return self.request('POST', url, data)
+
     def set_music_favorite(self, mid, flag):
         url = uri + '/song/like'
         data = {
@@ -378,6 +393,7 @@ class Api(object):
     def _aes_encrypt(self, text, key):
         pad = 16 - len(text) % 16
         text = text + pad * chr(pad)
+        from Crypto.Cipher import AES
         encryptor = AES.new(bytes(key, 'utf-8'), 2, b'0102030405060708')
         enc_text = encryptor.encrypt(text)
         enc_text_encode = base64.b64encode(enc_text)
@@ -391,6 +407,7 @@ class Api(object):
             'bee255932575cce10b424d813cfe4875d3e82047b97ddef52741d546b'\
             '8e289dc6935b3ece0462db0a22b8e7'
         reverse_text = text[::-1]
+        from Crypto.PublicKey import RSA
         pub_key = RSA.construct([int(n, 16), int(e, 16)])
         encrypt_text = pub_key.encrypt(int(binascii.hexlify(reverse_text), 16),
                                        None)[0]
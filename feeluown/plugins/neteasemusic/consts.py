@@ -4,6 +4,9 @@ from feeluown.consts import DATA_DIR, HOME_DIR
 COOKIES_FILE = DATA_DIR + '/ne_cookies.json'
 USER_PW_FILE = DATA_DIR + '/nem_user_pw.json'
 USERS_INFO_FILE = DATA_DIR + '/nem_users_info.json'
+DOWNLOAD_QUEUE_FILE = DATA_DIR + '/nem_download_queue.json'
+LOCAL_SONGS_FILE = DATA_DIR + '/nem_local_songs.json'
+PLAYLISTS_CACHE_FILE = DATA_DIR + '/nem_playlists_cache.json'
 
 SOURCE = 'neteasemusic'
 LOG_FILE = HOME_DIR + '/neteasemusic.log'
@@ -1,90 +1,301 @@
 import asyncio
+from collections import deque, OrderedDict
+from enum import Enum
 from functools import partial
+import json
 import logging
 import os
 
 from PyQt5.QtCore import QObject, pyqtSignal
 
+from feeluown.config import config
 from feeluown.consts import SONG_DIR
-from feeluown.utils import emit_requests_progress
+from feeluown.utils import stream_to_file
+
+from .consts import DOWNLOAD_QUEUE_FILE
+from .local_index import local_index
+from .model import NSongModel
+from .segmented import SegmentedFetcher
 
 
 logger = logging.getLogger(__name__)
 
 
+class TaskState(Enum):
+    pending = 'pending'
+    downloading = 'downloading'
+    finished = 'finished'
+    failed = 'failed'
+
+
+class DownloadTask(object):
+    def __init__(self, mid, title, filename, song=None):
+        self.mid = mid
+        self.title = title
+        self.filename = filename
+        self.song = song
+
+        self.state = TaskState.pending
+        self.bytes_so_far = 0
+        self.total_size = None
+
+    @property
+    def progress(self):
+        if not self.total_size:
+            return 0
+        return round(self.bytes_so_far * 1.0 / self.total_size * 100)
+
+    @property
+    def f_path(self):
+        return os.path.join(SONG_DIR, self.filename)
+
+    def to_dict(self):
+        return {
+            'mid': self.mid,
+            'title': self.title,
+            'filename': self.filename,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['mid'], data['title'], data['filename'])
+
+    @classmethod
+    def from_song(cls, song):
+        return cls(song.mid, song.title, local_index.filename_for(song), song)
+
+
 class Downloader(QObject):
     download_progress_signal = pyqtSignal([int])
+    task_changed_signal = pyqtSignal([object])
+
+    # failed tasks are kept for retry, finished ones are dropped
+    MAX_FAILED_TASKS = 100
 
     def __init__(self, app, parent=None):
         super().__init__(parent)
         self._app = app
 
-        self.is_downloading = False
-        self.current_song = None
-        self.queue = []
+        self._max_workers = config.download_workers
+        self._tasks = OrderedDict()     # song id -> DownloadTask
+        self._pending = deque()
+        self._running = set()
 
-    def _access_queue(self):
-        if self.queue:
-            song = self.queue.pop(0)
-            self.download_song(song)
-        else:
-            self._app.message('下载队列下载完毕')
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def set_max_workers(self, number):
+        self._max_workers = max(1, number)
+        self._schedule()
+
+    @property
+    def tasks(self):
+        return list(self._tasks.values())
+
+    def get_task(self, mid):
+        return self._tasks.get(mid)
 
     def download_song(self, song):
-        for s in self.queue:
-            if s.mid == song.mid:
-                self._app.message('%s 已经在下载队列中' % song.title)
-                self._app.message('当前正在下载 %s' % self.current_song.title)
-                return
-
-        if self.is_downloading:
-            if len(self.queue) > 10:
-                self._app.message('下载队列已满，请稍后加入', error=True)
-                return
-            self.queue.append(song)
-            self._app.message('%s 加入下载队列之中' % song.title)
+        task = self._tasks.get(song.mid)
+        if task is not None and task.state in (TaskState.pending,
+                                               TaskState.downloading):
+            self._app.message('%s 已经在下载队列中' % song.title)
+            return
+        self._add_task(DownloadTask.from_song(song))
+        self._app.message('%s 加入下载队列之中' % song.title)
+        self._save_queue()
+        self._schedule()
+
+    def download_songs(self, songs):
+        count = 0
+        for song in songs:
+            task = self._tasks.get(song.mid)
+            if task is not None and task.state != TaskState.failed:
+                continue
+            self._add_task(DownloadTask.from_song(song))
+            count += 1
+        self._app.message('%d 首歌曲加入下载队列之中' % count)
+        self._save_queue()
+        self._schedule()
+
+    def retry(self, mid):
+        task = self._tasks.get(mid)
+        if task is None or task.state != TaskState.failed:
+            return False
+        self._add_task(task)
+        self._save_queue()
+        self._schedule()
+        return True
+
+    def restore(self):
+        """restore unfinished tasks from download queue journal"""
+        if not os.path.exists(DOWNLOAD_QUEUE_FILE):
+            return
+        try:
+            with open(DOWNLOAD_QUEUE_FILE, 'r') as f:
+                tasks_data = json.load(f)
+        except (OSError, ValueError):
+            logger.exception('load download queue journal failed')
             return
+        for data in tasks_data:
+            if data['mid'] not in self._tasks:
+                self._add_task(DownloadTask.from_dict(data))
+        if self._pending:
+            logger.info('restore %d download tasks' % len(self._pending))
+            self._app.message('继续下载 %d 首歌曲' % len(self._pending))
+        self._schedule()
+
+    def _add_task(self, task):
+        task.state = TaskState.pending
+        self._tasks[task.mid] = task
+        self._pending.append(task)
+        self.task_changed_signal.emit(task)
 
-        self.is_downloading = True
+    def _save_queue(self):
+        tasks_data = [task.to_dict() for task in self._tasks.values()
+                      if task.state in (TaskState.pending,
+                                        TaskState.downloading)]
+        tmp_path = DOWNLOAD_QUEUE_FILE + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(tasks_data, f)
+            os.replace(tmp_path, DOWNLOAD_QUEUE_FILE)
+        except OSError:
+            logger.exception('save download queue journal failed')
+
+    def _schedule(self):
         event_loop = asyncio.get_event_loop()
-        event_loop.create_task(self._download(song))
+        while self._pending and len(self._running) < self._max_workers:
+            task = self._pending.popleft()
+            self._running.add(task)
+            event_loop.create_task(self._run(task))
+
+    def _set_state(self, task, state):
+        task.state = state
+        self.task_changed_signal.emit(task)
+        if state != TaskState.downloading:
+            self._save_queue()
+
+    def _drop_done_tasks(self, task):
+        if self._tasks.get(task.mid) is not task:
+            return
+        if task.state == TaskState.finished:
+            del self._tasks[task.mid]
+            return
+        self._tasks.move_to_end(task.mid)
+        failed = [t for t in self._tasks.values()
+                  if t.state == TaskState.failed]
+        for t in failed[:-self.MAX_FAILED_TASKS]:
+            del self._tasks[t.mid]
+
+    def _on_progress(self, task, bytes_so_far, total_size):
+        old_progress = task.progress
+        task.bytes_so_far = bytes_so_far
+        task.total_size = total_size
+        if task.progress != old_progress:
+            self.task_changed_signal.emit(task)
+            self.download_progress_signal.emit(task.progress)
+
+    @asyncio.coroutine
+    def _run(self, task):
+        self._set_state(task, TaskState.downloading)
+        try:
+            ok = yield from self._download(task)
+        except Exception:
+            logger.exception('download song %s failed' % task.title)
+            ok = False
+        self._running.discard(task)
+        if ok:
+            local_index.add(task.mid, task.filename)
+            self._set_state(task, TaskState.finished)
+            self._app.message('%s 下载成功' % task.title)
+        else:
+            self._set_state(task, TaskState.failed)
+            self._app.message('下载 %s 失败' % task.title, error=True)
+        self._drop_done_tasks(task)
+        if not self._pending and not self._running:
+            self._app.message('下载队列下载完毕')
+        self._schedule()
 
     @asyncio.coroutine
-    def _download(self, song):
-        f_name = song.filename
-        f_path = os.path.join(SONG_DIR, f_name)
+    def _download(self, task):
+        f_path = task.f_path
         if os.path.exists(f_path):
-            logger.warning('%s have been downloaded' % song.title)
-            self._app.message('%s 这首歌已经存在' % song.title)
-            self.is_downloading = False
-            self._access_queue()
+            logger.warning('%s have been downloaded' % task.title)
+            self._app.message('%s 这首歌已经存在' % task.title)
             return True
-        self.current_song = song
-        if song.url is not None:
-            try:
-                event_loop = asyncio.get_event_loop()
-                self._app.message('准备下载 %s' % song.title)
-                res = song._api.http.get(song.url, stream=True, timeout=30)
-                if res.status_code != 200:
-                    raise Exception('response not ok while download song')
-                future = event_loop.run_in_executor(
-                    None,
-                    partial(emit_requests_progress, res,
-                            self.download_progress_signal))
-                content = yield from future
-                if not content:
-                    raise Exception('error in downloaded song')
-                with open(f_path, 'wb') as f:
-                    f.write(content)
-                logger.info('download song %s successfully' % song.title)
-                self._app.message('%s 下载成功' % song.title)
-                self.is_downloading = False
-                self._access_queue()
-                return True
-            except Exception as e:
-                logger.error(e)
-
-        self._app.message('下载 %s 失败' % song.title, error=True)
-        self.is_downloading = False
-        self._access_queue()
-        return False
+
+        event_loop = asyncio.get_event_loop()
+        if task.song is None:
+            task.song = yield from event_loop.run_in_executor(
+                None, partial(NSongModel.get, task.mid))
+            if task.song is None:
+                return False
+        song = task.song
+        url = yield from event_loop.run_in_executor(
+            None, lambda: song.url)
+        if url is None:
+            return False
+
+        self._app.message('准备下载 %s' % task.title)
+        # progress is reported in executor thread, update task in loop
+        on_progress = partial(event_loop.call_soon_threadsafe,
+                              self._on_progress, task)
+        future = event_loop.run_in_executor(
+            None, partial(self._fetch, task, url, on_progress))
+        yield from future
+        logger.info('download song %s successfully' % task.title)
+        return True
+
+    def _fetch(self, task, url, on_progress):
+        """fetch url to task file, resume from the part file if possible
+
+        It is blocking and should be run in executor.
+        """
+        part_path = task.f_path + '.part'
+        plain_part_exists = os.path.exists(part_path) and \
+            not os.path.exists(task.f_path + '.segments')
+        http = task.song._api.http
+        if config.download_segments > 1 and not plain_part_exists:
+            fetcher = SegmentedFetcher(http, url, task.f_path,
+                                       config.download_segments,
+                                       on_progress,
+                                       self._app.bandwidth_scheduler.throttle)
+            size = fetcher.fetch()
+            if size is not None:
+                return size
+            logger.info('range is not supported, download %s in one stream'
+                        % task.title)
+            if os.path.exists(fetcher.segments_path):
+                # a preallocated part file can not be resumed by offset
+                os.remove(fetcher.segments_path)
+                os.remove(part_path)
+
+        offset = 0
+        headers = {}
+        if os.path.exists(part_path):
+            offset = os.path.getsize(part_path)
+            headers['Range'] = 'bytes=%d-' % offset
+        res = http.get(url, stream=True, timeout=30, headers=headers)
+        if res is None:
+            raise IOError('request song %s failed' % task.title)
+        if res.status_code == 200:
+            # server ignores the range header, download it again
+            offset = 0
+        elif res.status_code == 416:
+            # part file is broken, discard it and start over next time
+            res.close()
+            os.remove(part_path)
+            raise IOError('range not satisfiable for %s' % task.title)
+        elif res.status_code == 206:
+            logger.info('resume downloading %s from %d'
+                        % (task.title, offset))
+        else:
+            raise IOError('response not ok while download song: %d'
+                          % res.status_code)
+        try:
+            return stream_to_file(res, task.f_path, offset, on_progress,
+                                  self._app.bandwidth_scheduler.throttle)
+        finally:
+            res.close()
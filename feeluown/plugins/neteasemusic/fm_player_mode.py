@@ -1,5 +1,6 @@
+import asyncio
 import logging
-from feeluown.player_mode import PlayerModeBase
+from feeluown.player_mode import PlayerModeBase, SongBuffer
 
 from .model import NUserModel
 
@@ -8,11 +9,15 @@ logger = logging.getLogger(__name__)
 
 
 class FM_mode(PlayerModeBase):
+    # fm api returns several songs at once, keep more than one batch
+    LOW_WATER = 4
+
     def __init__(self, app):
         super().__init__(app)
         self.player = app.player
         self._name = 'FM'
-        self._songs = []
+        self._buffer = SongBuffer(NUserModel.get_fm_song, self.LOW_WATER)
+        self._active = False
 
     @property
     def name(self):
@@ -20,19 +25,25 @@ class FM_mode(PlayerModeBase):
 
     def on_playlist_finished(self):
         logger.debug('fm mode: playlist finished')
-        song = self._get_song()
-        self.player.other_mode_play(song)
+        asyncio.Task(self._play_next())
 
     def load(self):
         self.player.stop()
-        song = self._get_song()
-        if song is not None:
-            self.player.other_mode_play(song)
-        else:
-            self.unload()
-
-    def _get_song(self):
-        if not self._songs:
-            self._songs = NUserModel.get_fm_song()
-        song = self._songs.pop(0)
-        return song
+        self._active = True
+        asyncio.Task(self._play_next())
+
+    def unload(self):
+        self._active = False
+        super().unload()
+
+    @asyncio.coroutine
+    def _play_next(self):
+        song = yield from self._buffer.get()
+        if not self._active:
+            return
+        if song is None:
+            self._app.message('获取私人 FM 歌曲失败', error=True)
+            logger.warning('fm mode: no song available')
+            self._app.player_mode_manager.exit_to_normal()
+            return
+        self.player.other_mode_play(song)
@@ -0,0 +1,103 @@
+import asyncio
+from collections import OrderedDict
+import logging
+
+from .api import api
+
+
+logger = logging.getLogger(__name__)
+
+
+class Hydrator(object):
+    """fill songs with details fetched by ``songs_detail`` in batches
+
+    Views call :meth:`request` with the songs they show. Songs requested
+    within ``DELAY`` seconds are merged and deduplicated by id, split into
+    chunks of ``CHUNK_SIZE`` ids, and the chunks are fetched concurrently
+    in executor. :meth:`fetch` is the blocking variant for models.
+    """
+    CHUNK_SIZE = 100
+    DELAY = 0.05
+
+    def __init__(self, api=api):
+        self._api = api
+        self._pending = OrderedDict()   # mid -> songs waiting for detail
+        self._waiters = []
+        self._handle = None
+
+    def _fetch_chunk(self, mids):
+        data = self._api.songs_detail(mids)
+        if data is None or data.get('code') != 200:
+            logger.warning('get detail of %d songs failed' % len(mids))
+            return {}
+        return {song_data['id']: song_data for song_data in data['songs']}
+
+    def _chunks(self, mids):
+        for i in range(0, len(mids), self.CHUNK_SIZE):
+            yield mids[i:i + self.CHUNK_SIZE]
+
+    def _fill(self, songs_by_mid, details):
+        for mid, songs in songs_by_mid.items():
+            song_data = details.get(mid)
+            if song_data is not None:
+                for song in songs:
+                    song.fill_detail(song_data)
+
+    def _group(self, songs, force=False):
+        songs_by_mid = OrderedDict()
+        for song in songs:
+            if force or song.need_detail():
+                songs_by_mid.setdefault(song.mid, []).append(song)
+        return songs_by_mid
+
+    def fetch(self, songs, force=False):
+        """fetch details of songs now, it blocks
+
+        :param force: fetch even if songs already have details
+        """
+        songs_by_mid = self._group(songs, force)
+        details = {}
+        for chunk in self._chunks(list(songs_by_mid)):
+            details.update(self._fetch_chunk(chunk))
+        self._fill(songs_by_mid, details)
+
+    def request(self, songs):
+        """fetch details of songs later, return a future done after it"""
+        for mid, group in self._group(songs).items():
+            self._pending.setdefault(mid, []).extend(group)
+        future = asyncio.Future()
+        if not self._pending:
+            future.set_result(None)
+            return future
+        self._waiters.append(future)
+        if self._handle is None:
+            event_loop = asyncio.get_event_loop()
+            self._handle = event_loop.call_later(
+                self.DELAY, lambda: asyncio.Task(self._flush()))
+        return future
+
+    @asyncio.coroutine
+    def _flush(self):
+        self._handle = None
+        songs_by_mid, self._pending = self._pending, OrderedDict()
+        waiters, self._waiters = self._waiters, []
+        event_loop = asyncio.get_event_loop()
+        futures = [event_loop.run_in_executor(None, self._fetch_chunk, chunk)
+                   for chunk in self._chunks(list(songs_by_mid))]
+        logger.debug('get detail of %d songs in %d requests'
+                     % (len(songs_by_mid), len(futures)))
+        results = yield from asyncio.gather(*futures,
+                                            return_exceptions=True)
+        details = {}
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error('get songs detail failed: %s' % result)
+            else:
+                details.update(result)
+        self._fill(songs_by_mid, details)
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+hydrator = Hydrator()
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import time
+
+from feeluown.consts import SONG_DIR
+
+from .consts import LOCAL_SONGS_FILE
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalSongIndex(object):
+    """in-memory index of songs downloaded to SONG_DIR
+
+    Songs are looked up by id first, the id is recorded when a song is
+    downloaded. Files which have no record, such as files downloaded by
+    older versions, are matched by filename instead.
+
+    The directory is rescanned only when its mtime changes, and the mtime
+    is checked at most once per ``CHECK_INTERVAL`` seconds.
+    """
+    CHECK_INTERVAL = 2
+
+    def __init__(self, song_dir=SONG_DIR, index_file=LOCAL_SONGS_FILE):
+        self._song_dir = song_dir
+        self._index_file = index_file
+
+        self._ids = {}  # song id -> filename
+        self._owners = {}  # filename -> song id
+        self._filenames = set()
+        self._dir_mtime = None
+        self._last_check_ts = None
+
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._index_file):
+            return
+        try:
+            with open(self._index_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.exception('load local songs index failed')
+            return
+        self._ids = {int(mid): filename for mid, filename in data.items()}
+        self._owners = {filename: mid for mid, filename in self._ids.items()}
+
+    def _save(self):
+        tmp_path = self._index_file + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._ids, f)
+            os.replace(tmp_path, self._index_file)
+        except OSError:
+            logger.exception('save local songs index failed')
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._last_check_ts is not None and \
+                now - self._last_check_ts < self.CHECK_INTERVAL:
+            return
+        self._last_check_ts = now
+        try:
+            mtime = os.stat(self._song_dir).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._dir_mtime:
+            return
+        self._dir_mtime = mtime
+        if mtime is None:
+            self._filenames = set()
+        else:
+            self._filenames = set(os.listdir(self._song_dir))
+        logger.debug('rescan %s, %d files' % (self._song_dir,
+                                              len(self._filenames)))
+
+    def _find(self, song):
+        filename = self._ids.get(song.mid)
+        if filename is not None and filename in self._filenames:
+            return filename
+        if song.filename in self._filenames and \
+                song.filename not in self._owners:
+            return song.filename
+        return None
+
+    def lookup(self, song):
+        """return song file path if exists, else None"""
+        self._refresh()
+        filename = self._find(song)
+        if filename is None:
+            return None
+        return os.path.join(self._song_dir, filename)
+
+    def lookup_many(self, songs):
+        """return the set of ids of songs which are downloaded"""
+        self._refresh()
+        return {song.mid for song in songs if self._find(song) is not None}
+
+    def filename_for(self, song):
+        """choose a filename which does not collide with other songs"""
+        self._refresh()
+        filename = self._ids.get(song.mid)
+        if filename is not None:
+            return filename
+        filename = song.filename
+        if filename in self._owners:
+            name, ext = os.path.splitext(filename)
+            filename = '%s (%d)%s' % (name, song.mid, ext)
+        return filename
+
+    def add(self, mid, filename):
+        self._ids[mid] = filename
+        self._owners[filename] = mid
+        self._filenames.add(filename)
+        self._save()
+
+
+local_index = LocalSongIndex()
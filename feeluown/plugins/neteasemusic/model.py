@@ -2,12 +2,14 @@ import datetime
 import json
 import logging
 import os
+import weakref
 
 from feeluown.model import SongModel, PlaylistModel
-from feeluown.consts import SONG_DIR
 
 from .api import api
-from .consts import USERS_INFO_FILE, SOURCE
+from .consts import USERS_INFO_FILE, PLAYLISTS_CACHE_FILE, SOURCE
+from .hydrator import hydrator
+from .local_index import local_index
 
 logger = logging.getLogger(__name__)
 
@@ -104,18 +106,30 @@ class NSongModel(SongModel):
         return self._candidate_url
 
     def get_detail(self):
-        data = self._api.song_detail(self.mid)
-        if data is not None:
-            song = data['songs'][0]
-            self._candidate_url = song['mp3Url']
-            self.album._img = song['album']['picUrl']
+        hydrator.fetch([self], force=True)
+
+    def need_detail(self):
+        return not self.album._img
+
+    def fill_detail(self, song_data):
+        '''fill fields which brief song data may lack'''
+        self._candidate_url = song_data.get('mp3Url')
+        self.album._img = song_data['album']['picUrl']
 
-    def get_simi_songs(self):
-        data = self._api.get_similar_song(self.mid)
+    def get_lyric(self):
+        '''return raw lyric and its translation, None if request fails'''
+        data = self._api.get_lyric_by_musicid(self.mid)
+        if data is None or data.get('code') != 200:
+            return None
+        return {'lrc': (data.get('lrc') or {}).get('lyric') or '',
+                'tlrc': (data.get('tlyric') or {}).get('lyric') or ''}
+
+    def get_simi_songs(self, offset=0, limit=10):
+        data = self._api.get_similar_song(self.mid, offset, limit)
         if data is None:
             return []
         if data['code'] == 200:
-            return [NSongModel.pure_create(data['songs'][0])]
+            return NSongModel.batch_create(data['songs'])
         else:
             return []
 
@@ -154,6 +168,19 @@ class NSongModel(SongModel):
     def batch_create(cls, datas):
         return [cls.pure_create(data) for data in datas]
 
+    def to_queue_extra(self):
+        '''ids which are needed to restore song from queue store'''
+        return {'album_id': self.album.bid,
+                'artists': [[x.aid, x.name] for x in self.artists]}
+
+    @classmethod
+    def create_from_queue(cls, data):
+        '''create song from fields saved by queue store, without network'''
+        artists = [NArtistModel(aid, name) for aid, name in data['artists']]
+        album = NAlbumModel(data['album_id'], data['album_name'],
+                            data['artists_name'])
+        return cls(data['mid'], data['title'], data['length'], artists, album)
+
     @classmethod
     def search(cls, text):
         data = cls._api.search(text)
@@ -163,7 +190,6 @@ class NSongModel(SongModel):
                 songs = data['result']['songs']
         return cls.batch_create(songs)
 
-    # TODO: some songs may have same title and artists_name, temp ignore
     @property
     def filename(self):
         return self._title + ' - ' + self.artists_name + '.mp3'
@@ -171,12 +197,12 @@ class NSongModel(SongModel):
     @classmethod
     def local_exists(cls, song):
         '''return song file path if exists, else None'''
-        f_name = song.filename
-        f_path = os.path.join(SONG_DIR, f_name)
-        if os.path.exists(f_path):
-            return f_path
-        else:
-            return None
+        return local_index.lookup(song)
+
+    @classmethod
+    def local_exists_many(cls, songs):
+        '''return ids of songs which exist in local'''
+        return local_index.lookup_many(songs)
 
 
 class NAlbumModel(object):
@@ -351,20 +377,58 @@ class NUserModel(object):
 
     @property
     def playlists(self):
-        if self._playlists:
-            return self._playlists
+        if not self._playlists:
+            self.fetch_playlists()
+        return self._playlists
+
+    def fetch_playlists(self):
+        '''fetch playlists from server and cache them in disk
+
+        :return: response code, None when network failed
+        '''
         data = self._api.user_playlist(self.uid)
         if data is None:
-            return []
-        playlists = data['playlist']
-        playlists_model = []
-        for p in playlists:
-            model = NPlaylistModel(p['id'], p['name'], p['specialType'],
-                                   p['userId'], p['coverImgUrl'],
-                                   p['updateTime'], p['description'])
-            playlists_model.append(model)
-        self._playlists = playlists_model
-        return playlists_model
+            return None
+        if data.get('code') == 200:
+            playlists = data['playlist']
+            self._playlists = [NPlaylistModel.create_brief(p)
+                               for p in playlists]
+            self._save_playlists_cache(playlists)
+            logger.debug('playlists refreshed, alive: %s'
+                         % NPlaylistModel.stats())
+        return data.get('code')
+
+    # fields of a playlist which are used by NPlaylistModel.create_brief
+    _PLAYLIST_FIELDS = ('id', 'name', 'specialType', 'userId',
+                        'coverImgUrl', 'updateTime', 'description')
+
+    def _save_playlists_cache(self, playlists):
+        data = {
+            'uid': self.uid,
+            'playlists': [{k: p.get(k) for k in self._PLAYLIST_FIELDS}
+                          for p in playlists]
+        }
+        try:
+            with open(PLAYLISTS_CACHE_FILE, 'w') as f:
+                json.dump(data, f)
+        except OSError:
+            logger.exception('save playlists cache failed')
+
+    def load_playlists_cache(self):
+        '''load playlists cached in last run, return True if succeed'''
+        if not os.path.exists(PLAYLISTS_CACHE_FILE):
+            return False
+        try:
+            with open(PLAYLISTS_CACHE_FILE, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.exception('load playlists cache failed')
+            return False
+        if data.get('uid') != self.uid:
+            return False
+        self._playlists = [NPlaylistModel.create_brief(p)
+                           for p in data['playlists']]
+        return True
 
     @classmethod
     def create(cls, data):
@@ -461,7 +525,8 @@ class NUserModel(object):
 
 
 class NPlaylistModel(PlaylistModel):
-    instances = []
+    # pid -> playlist, a playlist leaves it once nobody refers to it
+    _registry = weakref.WeakValueDictionary()
     _api = api
 
     def __init__(self, pid, name, ptype, uid, cover_img, update_ts,
@@ -476,7 +541,7 @@ class NPlaylistModel(PlaylistModel):
         self._description = description
         self.last_update_ts = update_ts
 
-        NPlaylistModel.instances.append(self)
+        NPlaylistModel._registry[pid] = self
 
     @property
     def name(self):
@@ -504,32 +569,105 @@ class NPlaylistModel(PlaylistModel):
     def update_songs(self):
         self._songs = []
 
-    def add_song(self, mid):
-        data = self._api.op_music_to_playlist(mid, self.pid, op='add')
-        if data is None:
-            return False
-        if data['code'] == 502:
-            return False
-        elif data['code'] == 200:
-            self.update_songs()
+    # Track operations below change cached songs first and send one
+    # request for all songs, cached songs are restored if it fails.
+    # A new list is assigned instead of changing the old one in place,
+    # so they can be called in executor while the old list is shown.
+
+    def _apply(self, songs, request):
+        old_songs = self._songs
+        if old_songs:
+            self._songs = songs
+        data = request()
+        if data is not None and data.get('code') == 200:
             return True
+        if self._songs is songs:
+            self._songs = old_songs
+        return False
 
-    def del_song(self, mid):
-        data = self._api.op_music_to_playlist(mid, self.pid, op='del')
-        if data.get('code') == 200:
-            self.update_songs()
+    def add_songs(self, songs):
+        """add songs to the top of playlist, it blocks"""
+        mids = {song.mid for song in self._songs}
+        songs = [song for song in songs if song.mid not in mids]
+        if not songs:
             return True
-        return False
+        return self._apply(
+            songs + self._songs,
+            lambda: self._api.op_music_to_playlist(
+                [song.mid for song in songs], self.pid, op='add'))
+
+    def add_song(self, song):
+        return self.add_songs([song])
+
+    def del_songs(self, mids):
+        mids = set(mids)
+        return self._apply(
+            [song for song in self._songs if song.mid not in mids],
+            lambda: self._api.op_music_to_playlist(
+                list(mids), self.pid, op='del'))
+
+    def del_song(self, mid):
+        return self.del_songs([mid])
+
+    def move_songs(self, mids, index):
+        """move songs before the song at index of current order
+
+        Songs must be loaded, since the whole order is sent.
+        """
+        if not self._songs:
+            return False
+        moved_mids = set(mids)
+        moved = [song for song in self._songs if song.mid in moved_mids]
+        rest = [song for song in self._songs if song.mid not in moved_mids]
+        # index in the list without moved songs
+        index = len([song for song in self._songs[:index]
+                     if song.mid not in moved_mids])
+        songs = rest[:index] + moved + rest[index:]
+        return self._apply(
+            songs,
+            lambda: self._api.update_playlist_order(
+                self.pid, [song.mid for song in songs]))
+
+    @classmethod
+    def get_playlist(cls, pid):
+        return cls._registry.get(pid)
+
+    @classmethod
+    def stats(cls):
+        '''number of alive playlists and songs cached by them'''
+        playlists = list(cls._registry.values())
+        return {'playlists': len(playlists),
+                'songs': sum(len(p._songs) for p in playlists)}
+
+    @classmethod
+    def del_songs_from_playlist(cls, mids, pid):
+        playlist = cls.get_playlist(pid)
+        if playlist is not None:
+            return playlist.del_songs(mids)
+        data = cls._api.op_music_to_playlist(list(mids), pid, op='del')
+        return data is not None and data.get('code') == 200
 
     @classmethod
     def del_song_from_playlist(cls, mid, pid):
-        for playlist in cls.instances:
-            if playlist.pid == pid:
-                return playlist.del_song(mid)
-        data = cls._api.op_music_to_playlist(mid, pid, op='del')
-        if data['code'] == 200:
-            return True
-        return False
+        return cls.del_songs_from_playlist([mid], pid)
+
+    @classmethod
+    def create_brief(cls, data):
+        '''create playlist, an alive playlist of same pid is reused'''
+        playlist = cls._registry.get(data['id'])
+        if playlist is None:
+            return cls(data['id'], data['name'], data['specialType'],
+                       data['userId'], data['coverImgUrl'],
+                       data['updateTime'], data['description'])
+        playlist._name = data['name']
+        playlist.ptype = data['specialType']
+        playlist.cover_img = data['coverImgUrl']
+        playlist._description = data['description']
+        if playlist.last_update_ts != data['updateTime']:
+            # songs are changed somewhere else, load them again
+            playlist.last_update_ts = data['updateTime']
+            playlist.update_songs()
+        return playlist
 
     @classmethod
     def is_favorite(cls, model):
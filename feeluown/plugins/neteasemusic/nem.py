@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 import os
+import time
 from functools import partial
 
 from PyQt5.QtCore import QObject
@@ -15,6 +16,7 @@ from .fm_player_mode import FM_mode
 from .simi_player_mode import Simi_mode
 from .model import (NUserModel, NSongModel, NArtistModel,
                     NAlbumModel, NPlaylistModel)
+from .service import NemService
 from .ui import Ui, SongsTable, PlaylistItem
 
 logger = logging.getLogger(__name__)
@@ -25,16 +27,18 @@ class Nem(QObject):
     def __init__(self, app):
         super().__init__(parent=app)
         self._app = app
-        api.set_http(self._app.request)
+        self._enable_ts = time.perf_counter()
+        self.service = NemService(self._app)
 
         self.ui = Ui(self._app)
         self.downloader = Downloader(self._app, self)
 
         self.user = None
-        self.download_queue = []
+        self._playlist_items = {}   # pid -> PlaylistItem
 
         self.registe_hotkey()
         self.init_signal_binding()
+        self.downloader.restore()
 
     def init_signal_binding(self):
         self.downloader.download_progress_signal.connect(
@@ -100,14 +104,12 @@ class Nem(QObject):
         logger.info('save username and password to %s' % USER_PW_FILE)
 
     def ready_to_login(self):
-        model = NUserModel.load()
+        model = self.service.login_last_user()
         if model is None:
             self.ui.login_dialog.show()
             self.load_user_pw()
         else:
-            logger.info('load last user.')
             self.user = model
-            NUserModel.set_current_user(model)
             self._on_login_in()
 
     def login(self):
@@ -145,19 +147,70 @@ class Nem(QObject):
             None,
             partial(self.ui.login_btn.set_avatar, self.user.img))
         self.user.save()
-        self.load_playlists()
+        # show playlists of last run at once, then refresh them from server
+        if self.user.load_playlists_cache():
+            self.show_playlists()
+            self._log_startup_time('cached playlists shown')
+        asyncio.Task(self.load_playlists())
 
+    def _log_startup_time(self, stage):
+        logger.info('startup: %s in %.1fms'
+                    % (stage, (time.perf_counter() - self._enable_ts) * 1000))
+
+    @asyncio.coroutine
     def load_playlists(self):
         self._app.message('正在加载网易云音乐歌单')
+        event_loop = asyncio.get_event_loop()
+        code = yield from event_loop.run_in_executor(
+            None, self.user.fetch_playlists)
+        if code is None:
+            self._app.message('加载网易云音乐歌单失败', error=True)
+            return
+        if code != 200:
+            logger.warning('fetch playlists failed, code: %s' % code)
+            self._app.message('登录已失效，请重新登录', error=True)
+            self.ui.login_dialog.show()
+            self.load_user_pw()
+            return
+        self.show_playlists()
+        self._log_startup_time('playlists loaded')
+
+        favorite = None
+        for playlist in self.user.playlists:
+            if NPlaylistModel.is_favorite(playlist):
+                favorite = playlist
+        # do not replace what user is viewing
+        if favorite is None or \
+                self.ui.songs_table_container.songs_table is not None:
+            return
+        yield from event_loop.run_in_executor(None, lambda: favorite.songs)
+        if self.ui.songs_table_container.songs_table is None:
+            self.load_playlist(favorite)
+            self._log_startup_time('favorite playlist loaded')
+
+    def show_playlists(self):
         playlist_widget = self._app.ui.central_panel.left_panel.playlists_panel
+        pids = set()
         for playlist in self.user.playlists:
+            pids.add(playlist.pid)
+            item = self._playlist_items.get(playlist.pid)
+            if item is not None:
+                # playlist may be renamed
+                item.model = playlist
+                item.set_name(playlist.name)
+                continue
             item = PlaylistItem(self._app, playlist)
             if item.existed:
                 continue
             item.load_playlist_signal.connect(self.load_playlist)
             playlist_widget.add_item(item)
-            if NPlaylistModel.is_favorite(playlist):
-                self.load_playlist(playlist)
+            self._playlist_items[playlist.pid] = item
+        # playlists deleted elsewhere
+        for pid in list(self._playlist_items):
+            if pid not in pids:
+                item = self._playlist_items.pop(pid)
+                PlaylistItem.pids.discard(pid)
+                playlist_widget.remove_item(item)
 
     def play_song(self, song):
         self._app.player.play(song)
@@ -192,6 +245,8 @@ class Nem(QObject):
         songs_table.set_songs(songs)
         songs_table.play_song_signal.connect(self.play_song)
         songs_table.download_song_signal.connect(self.downloader.download_song)
+        songs_table.download_songs_signal.connect(
+            self.downloader.download_songs)
         songs_table.play_mv_signal.connect(self.play_mv)
         songs_table.show_artist_signal.connect(self.load_artist)
         songs_table.show_album_signal.connect(self.load_album)
@@ -0,0 +1,85 @@
+from collections import deque
+import logging
+import random
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class RadioEngine(object):
+    """endless radio built from similar songs of seed songs
+
+    Similar songs of every seed are fetched page by page and merged into a
+    deduplicated candidate pool. A candidate similar to several seeds
+    scores higher, and local history raises the score of songs which are
+    listened to and lowers the score of songs which are often skipped.
+    Every song taken from the pool becomes a seed of later songs.
+
+    :meth:`fetch` is blocking, it is designed to be the fetch function of
+    :class:`feeluown.player_mode.SongBuffer`.
+    """
+    PAGE_SIZE = 50
+    MAX_PAGES = 2
+    POOL_LOW_WATER = 10
+    BATCH_SIZE = 5
+    MAX_SEEDS = 20
+
+    def __init__(self, seed, counts=None):
+        """
+        :param counts: ``{str(mid): (play count, skip count)}`` from history
+        """
+        self._counts = counts or {}
+        self._lock = threading.Lock()
+        self._seeds = deque([seed], maxlen=self.MAX_SEEDS)
+        self._pool = {}     # mid -> [score, song]
+        self._seen = {seed.mid}     # songs played or pooled
+
+    def add_seed(self, song):
+        with self._lock:
+            self._seeds.append(song)
+            self._seen.add(song.mid)
+
+    def _history_score(self, mid):
+        play_count, skip_count = self._counts.get(str(mid), (0, 0))
+        return 0.2 * min(play_count, 5) - 0.5 * min(skip_count, 4)
+
+    def _expand(self, seed):
+        for page in range(self.MAX_PAGES):
+            songs = seed.get_simi_songs(page * self.PAGE_SIZE, self.PAGE_SIZE)
+            with self._lock:
+                for song in songs:
+                    if song.mid in self._pool:
+                        self._pool[song.mid][0] += 1
+                    elif song.mid not in self._seen:
+                        score = 1 + self._history_score(song.mid)
+                        self._pool[song.mid] = [score, song]
+            if len(songs) < self.PAGE_SIZE:
+                break
+
+    def _take(self, size):
+        with self._lock:
+            # random jitter keeps equal scores from a fixed order
+            ranked = sorted(self._pool.values(),
+                            key=lambda item: item[0] + random.random() * 0.5,
+                            reverse=True)
+            songs = [song for _, song in ranked[:size]]
+            for song in songs:
+                del self._pool[song.mid]
+                self._seen.add(song.mid)
+        return songs
+
+    def _next_seed(self):
+        with self._lock:
+            return self._seeds.popleft() if self._seeds else None
+
+    def fetch(self):
+        while len(self._pool) < self.POOL_LOW_WATER:
+            seed = self._next_seed()
+            if seed is None:
+                break
+            self._expand(seed)
+        songs = self._take(self.BATCH_SIZE)
+        logger.debug('radio: %d songs taken, %d songs in pool'
+                     % (len(songs), len(self._pool)))
+        return songs
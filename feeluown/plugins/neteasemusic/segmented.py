@@ -0,0 +1,236 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentedFetcher(object):
+    """fetch one url with several concurrent ranged requests
+
+    The file is split into byte ranges which are fetched by a pool of
+    workers with the given http client and written in place into the
+    ``.part`` file. Segment size follows the observed throughput so that
+    one segment takes about ``SEGMENT_SECONDS`` to download. Finished
+    ranges are recorded in a ``.segments`` file so an interrupted download
+    can be resumed. A failed range is fetched again after a backoff, at
+    most ``MAX_RETRY_TIMES`` times.
+    """
+    MIN_SEGMENT_SIZE = 256 * 1024
+    MAX_SEGMENT_SIZE = 8 * 1024 * 1024
+    SEGMENT_SECONDS = 2
+    MAX_RETRY_TIMES = 3
+    RETRY_DELAY = 0.5   # seconds, doubled on every retry of a range
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, http, url, f_path, workers=4, callback=None,
+                 throttle=None, timeout=30):
+        self._http = http
+        self.url = url
+        self.f_path = f_path
+        self.part_path = f_path + '.part'
+        self.segments_path = f_path + '.segments'
+        self.workers = workers
+        self.timeout = timeout
+        self._callback = callback
+        self._throttle = throttle
+
+        self._lock = threading.Condition()
+        self.total_size = None
+        self._next_offset = 0
+        self._segment_size = self.MIN_SEGMENT_SIZE
+        self._retry_ranges = []
+        self._inflight = 0
+        self._done_ranges = []
+        self._bytes_so_far = 0
+        self._error = None
+
+    def probe(self):
+        """return total size if server accepts range requests, else None"""
+        res = self._get({'Range': 'bytes=0-0'})
+        res.close()
+        if res.status_code != 206:
+            return None
+        match = re.match(r'bytes 0-0/(\d+)',
+                         res.headers.get('content-range', ''))
+        if match is None:
+            return None
+        return int(match.group(1))
+
+    def fetch(self):
+        """download the whole file
+
+        :return: file size, or None when server does not support ranges
+        """
+        self.total_size = self.probe()
+        if self.total_size is None:
+            return None
+        self._prepare()
+        workers = min(self.workers,
+                      max(1, self.total_size // self.MIN_SEGMENT_SIZE))
+        logger.debug('fetch %s with %d workers' % (self.url, workers))
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(self._work) for _ in range(workers)]
+            for future in futures:
+                future.result()
+        if self._error is not None:
+            raise self._error
+        self._commit()
+        return self.total_size
+
+    def _get(self, headers):
+        res = self._http.get(self.url, headers=headers, stream=True,
+                             timeout=self.timeout)
+        if res is None:
+            raise IOError('request %s failed' % self.url)
+        return res
+
+    def _prepare(self):
+        if os.path.exists(self.part_path) and \
+                os.path.exists(self.segments_path) and \
+                os.path.getsize(self.part_path) == self.total_size:
+            with open(self.segments_path, 'r') as f:
+                self._done_ranges = [tuple(r) for r in json.load(f)]
+        else:
+            with open(self.part_path, 'wb') as f:
+                f.truncate(self.total_size)
+            self._done_ranges = []
+            # a preallocated part must not be taken as a sequential one
+            self._save_segments()
+        self._bytes_so_far = sum(end - start
+                                 for start, end in self._done_ranges)
+        # ranges which are not downloaded yet
+        offset = 0
+        for start, end in sorted(self._done_ranges):
+            if start > offset:
+                self._retry_ranges.append((offset, start, 0))
+            offset = max(offset, end)
+        self._next_offset = offset
+
+    def _take_range(self):
+        with self._lock:
+            while True:
+                if self._error is not None:
+                    return None
+                if self._retry_ranges:
+                    segment = self._retry_ranges.pop()
+                    break
+                if self._next_offset < self.total_size:
+                    start = self._next_offset
+                    end = min(start + self._segment_size, self.total_size)
+                    self._next_offset = end
+                    segment = (start, end, 0)
+                    break
+                if not self._inflight:
+                    return None
+                # a running range may fail and need to be fetched again
+                self._lock.wait()
+            self._inflight += 1
+            return segment
+
+    def _release_range(self, segment=None, error=None):
+        with self._lock:
+            self._inflight -= 1
+            if segment is not None:
+                self._retry_ranges.append(segment)
+            if error is not None:
+                self._error = error
+            self._lock.notify_all()
+
+    def _adapt(self, size, elapsed):
+        throughput = size / max(elapsed, 0.001)
+        segment_size = int(throughput * self.SEGMENT_SECONDS)
+        segment_size = max(self.MIN_SEGMENT_SIZE,
+                           min(self.MAX_SEGMENT_SIZE, segment_size))
+        with self._lock:
+            # smooth the value, one slow segment should not shrink it a lot
+            self._segment_size = (self._segment_size + segment_size) // 2
+
+    def _work(self):
+        with open(self.part_path, 'r+b') as f:
+            while True:
+                segment = self._take_range()
+                if segment is None:
+                    return
+                start, end, retry_times = segment
+                t = time.monotonic()
+                try:
+                    self._fetch_range(f, start, end)
+                except Exception as e:
+                    logger.warning('fetch range %d-%d failed: %s'
+                                   % (start, end, e))
+                    if retry_times >= self.MAX_RETRY_TIMES:
+                        self._release_range(error=e)
+                    else:
+                        # range is still in flight while waiting, so other
+                        # workers do not finish before it is fetched again
+                        time.sleep(self.RETRY_DELAY * 2 ** retry_times)
+                        self._release_range((start, end, retry_times + 1))
+                    continue
+                self._adapt(end - start, time.monotonic() - t)
+                self._on_range_done(start, end)
+                self._release_range()
+
+    def _fetch_range(self, f, start, end):
+        headers = {'Range': 'bytes=%d-%d' % (start, end - 1)}
+        res = self._get(headers)
+        try:
+            if res.status_code != 206:
+                raise IOError('range request not ok: %d' % res.status_code)
+            offset = start
+            try:
+                for chunk in res.iter_content(self.CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    chunk = chunk[:end - offset]
+                    if self._throttle is not None:
+                        self._throttle(len(chunk))
+                    f.seek(offset)
+                    f.write(chunk)
+                    offset += len(chunk)
+                    self._on_progress(len(chunk))
+                    if offset >= end:
+                        break
+                if offset != end:
+                    raise IOError('incomplete range %d-%d' % (start, end))
+            except Exception:
+                # count the partial range out, it will be fetched again
+                self._on_progress(start - offset)
+                raise
+            f.flush()
+        finally:
+            res.close()
+
+    def _on_progress(self, size):
+        with self._lock:
+            self._bytes_so_far += size
+            bytes_so_far = self._bytes_so_far
+        if self._callback is not None:
+            self._callback(bytes_so_far, self.total_size)
+
+    def _on_range_done(self, start, end):
+        with self._lock:
+            self._done_ranges.append((start, end))
+            self._save_segments()
+
+    def _save_segments(self):
+        tmp_path = self.segments_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._done_ranges, f)
+        os.replace(tmp_path, self.segments_path)
+
+    def _commit(self):
+        done_size = sum(end - start for start, end in self._done_ranges)
+        part_size = os.path.getsize(self.part_path)
+        if done_size != self.total_size or part_size != self.total_size:
+            raise IOError('segmented download is incomplete: %d/%d'
+                          % (done_size, self.total_size))
+        with open(self.part_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(self.part_path, self.f_path)
+        os.remove(self.segments_path)
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from functools import partial
+
+from feeluown.server import RpcError, INVALID_PARAMS, song_to_dict
+
+from .api import api
+from .consts import SOURCE
+from .model import NSongModel, NUserModel
+
+logger = logging.getLogger(__name__)
+
+
+class NemService(object):
+    """parts of the plugin which do not need widgets
+
+    They are shared by the gui and the headless daemon: http session,
+    queue restoring, lyrics and control server methods.
+    """
+    def __init__(self, app):
+        self._app = app
+        self._searched_songs = {}   # mid -> song, results of rpc search
+
+        api.set_http(self._app.request)
+        self._app.queue_store.register(SOURCE, NSongModel.create_from_queue,
+                                       NSongModel.to_queue_extra)
+        self._app.lyric_manager.register(SOURCE, NSongModel.get_lyric)
+        self.init_server_methods()
+
+    def login_last_user(self):
+        '''login with cookies of last user, return the user or None'''
+        user = NUserModel.load()
+        if user is None:
+            logger.warning('no saved user, login in gui first')
+            return None
+        logger.info('load last user.')
+        NUserModel.set_current_user(user)
+        return user
+
+    def init_server_methods(self):
+        server = self._app.server
+        server.register('netease.search', self.rpc_search)
+        server.register('netease.add', self.rpc_add)
+        server.register('netease.play', partial(self.rpc_add, play=True))
+
+    @asyncio.coroutine
+    def rpc_search(self, text):
+        event_loop = asyncio.get_event_loop()
+        songs = yield from event_loop.run_in_executor(
+            None, NSongModel.search, text)
+        self._searched_songs = {song.mid: song for song in songs}
+        return [song_to_dict(song) for song in songs]
+
+    @asyncio.coroutine
+    def rpc_add(self, mid, play=False):
+        '''add song to queue, songs just searched are got without network'''
+        song = self._searched_songs.get(mid)
+        if song is None:
+            event_loop = asyncio.get_event_loop()
+            song = yield from event_loop.run_in_executor(
+                None, NSongModel.get, mid)
+        if song is None:
+            raise RpcError(INVALID_PARAMS, 'song not found: %s' % mid)
+        if play:
+            self._app.player.play(song)
+        else:
+            self._app.player.add_music(song)
+        return song_to_dict(song)
@@ -1,7 +1,9 @@
+import asyncio
 import logging
-from feeluown.player_mode import PlayerModeBase
+from feeluown.player_mode import PlayerModeBase, SongBuffer
 
 from .consts import SOURCE
+from .radio import RadioEngine
 
 
 logger = logging.getLogger(__name__)
@@ -13,7 +15,9 @@ class Simi_mode(PlayerModeBase):
         self._app = app
         self.player = app.player
         self._name = 'SIMI'
-        self._songs = []
+        self._engine = None
+        self._buffer = None
+        self._active = False
 
     @property
     def name(self):
@@ -21,34 +25,45 @@ class Simi_mode(PlayerModeBase):
 
     def on_playlist_finished(self):
         logger.debug('simi mode: playlist finished')
-        song = self._get_song()
-        self.player.other_mode_play(song)
+        asyncio.Task(self._play_next())
 
     def load(self):
-        song = self._get_song()
-        if song is not None:
-            self.player.other_mode_play(song)
-        else:
+        song = self._check_player_song()
+        if song is None:
             self._app.message('不能进入相似歌曲播放模式', error=True)
             logger.warning('cant enter simi mode')
             # TODO: when PlayerModeManager call exit_to_normal, it call unload
             #       again
             self.unload()
+            return
+        self._active = True
+        asyncio.Task(self._start(song))
+
+    def unload(self):
+        self._active = False
+        super().unload()
 
-    def _get_song(self):
-        if not self._songs:
-            song = self._check_player_song()
-            if song is not None:
-                songs = song.get_simi_songs()
-                if songs:
-                    logger.error('this song has no similar songs')
-                    self._songs = songs
-                else:
-                    return None
-            else:
-                return None
-        song = self._songs.pop(0)
-        return song
+    @asyncio.coroutine
+    def _start(self, seed):
+        counts = yield from self._app.play_history.song_counts(SOURCE)
+        self._engine = RadioEngine(seed, counts)
+        self._buffer = SongBuffer(self._engine.fetch)
+        self._buffer.refill()
+        yield from self._play_next()
+
+    @asyncio.coroutine
+    def _play_next(self):
+        if self._buffer is None:
+            return
+        song = yield from self._buffer.get()
+        if not self._active:
+            return
+        if song is None:
+            self._app.message('没有找到相似歌曲', error=True)
+            logger.warning('simi mode: no similar songs')
+            return
+        self._engine.add_seed(song)
+        self.player.other_mode_play(song)
 
     def _check_player_song(self):
         song = self.player.current_song
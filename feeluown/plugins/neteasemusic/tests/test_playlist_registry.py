@@ -0,0 +1,54 @@
+import copy
+import gc
+import json
+import os
+import sys
+
+import pytest
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGINS_DIR = os.path.dirname(os.path.dirname(TESTS_DIR))
+
+# plugins are imported as top level packages, as feeluown does
+if PLUGINS_DIR not in sys.path:
+    sys.path.insert(0, PLUGINS_DIR)
+
+
+class FakeApi(object):
+    def __init__(self):
+        with open(os.path.join(TESTS_DIR, 'playlists.json')) as f:
+            self.data = json.load(f)
+
+    def user_playlist(self, uid):
+        # a new response every time, like a real request
+        return copy.deepcopy(self.data)
+
+
+@pytest.fixture
+def model(monkeypatch, tmp_path):
+    pytest.importorskip('requests')
+    from neteasemusic import model
+
+    monkeypatch.setattr(model.NUserModel, '_api', FakeApi())
+    monkeypatch.setattr(model, 'PLAYLISTS_CACHE_FILE',
+                        str(tmp_path / 'playlists_cache.json'))
+    return model
+
+
+def test_refresh_playlists_does_not_leak(model):
+    user = model.NUserModel('test', 18731323, 'test', '')
+    count = len(FakeApi().data['playlist'])
+
+    for _ in range(1000):
+        assert user.fetch_playlists() == 200
+    gc.collect()
+
+    assert len(user.playlists) == count
+    assert model.NPlaylistModel.stats()['playlists'] == count
+    playlist = user.playlists[0]
+    assert model.NPlaylistModel.get_playlist(playlist.pid) is playlist
+
+    del user, playlist
+    gc.collect()
+    assert model.NPlaylistModel.stats()['playlists'] == 0
@@ -12,6 +12,7 @@ from feeluown.widgets.components import MusicTable, LP_GroupItem, ImgLabel
 from feeluown.utils import set_alpha, parse_ms
 from feeluown.widgets.base import FLabel, FFrame, FDialog, FLineEdit, \
     FButton, FScrollArea
+from .hydrator import hydrator
 from .model import NPlaylistModel, NSongModel, NUserModel
 
 logger = logging.getLogger(__name__)
@@ -148,7 +149,7 @@ class LoginButton(FLabel):
 
 class PlaylistItem(LP_GroupItem):
     load_playlist_signal = pyqtSignal(NPlaylistModel)
-    pids = []
+    pids = set()
 
     def __init__(self, app, playlist=None, parent=None):
         super().__init__(app, playlist.name, parent=parent)
@@ -156,7 +157,7 @@ class PlaylistItem(LP_GroupItem):
         self.existed = False
         if playlist.pid in PlaylistItem.pids:
             self.existed = True
-        PlaylistItem.pids.append(playlist.pid)
+        PlaylistItem.pids.add(playlist.pid)
 
         self.model = playlist
         self.clicked.connect(self.on_clicked)
@@ -170,21 +171,26 @@ class PlaylistItem(LP_GroupItem):
         if not isinstance(source, SongsTable):
             return
         event.accept()
-        song = source.drag_song
-        if song is not None:
+        songs = source.drag_songs
+        if songs:
             user = NUserModel.current_user
             if user.is_playlist_mine(self.model.pid):
-                self.add_song_to_playlist(song)
-
-    def add_song_to_playlist(self, song):
-        logger.debug('temp to add "%s" to playlist "%s"' %
-                     (song.title, self.model.name))
-        if self.model.add_song(song.mid):
-            self._app.message('add "%s" to playlist "%s" success' %
-                              (song.title, self.model.name))
+                asyncio.Task(self.add_songs_to_playlist(songs))
+
+    @asyncio.coroutine
+    def add_songs_to_playlist(self, songs):
+        logger.debug('temp to add %d songs to playlist "%s"' %
+                     (len(songs), self.model.name))
+        event_loop = asyncio.get_event_loop()
+        # all songs are added in one request
+        ok = yield from event_loop.run_in_executor(
+            None, self.model.add_songs, songs)
+        if ok:
+            self._app.message('add %d songs to playlist "%s" success' %
+                              (len(songs), self.model.name))
         else:
-            self._app.message('add "%s" to playlist "%s" failed' %
-                              (song.title, self.model.name), error=True)
+            self._app.message('add %d songs to playlist "%s" failed' %
+                              (len(songs), self.model.name), error=True)
 
     def dragEnterEvent(self, event):
         event.accept()
@@ -256,6 +262,7 @@ class SongsTable(MusicTable):
     play_mv_signal = pyqtSignal([int])
     play_song_signal = pyqtSignal([NSongModel])
     download_song_signal = pyqtSignal([NSongModel])
+    download_songs_signal = pyqtSignal([list])
     show_artist_signal = pyqtSignal([int])
     show_album_signal = pyqtSignal([int])
     add_song_signal = pyqtSignal([NSongModel])
@@ -280,11 +287,13 @@ class SongsTable(MusicTable):
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
 
         self.setDragEnabled(True)
-        self.setDragDropMode(QAbstractItemView.DragOnly)
+        self.setDragDropMode(QAbstractItemView.DragDrop)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
 
         self._context_menu_row = 0
         self._drag_row = None
         self._playlist_id = 0
+        self._local_mids = None
 
     @pyqtSlot()
     def add_song_to_current_playlist(self):
@@ -304,16 +313,41 @@ class SongsTable(MusicTable):
         song = self.songs[self._context_menu_row]
         self.download_song_signal.emit(song)
 
+    @pyqtSlot()
+    def download_all_songs(self):
+        '''do not call explicit, just a slot function'''
+        self.download_songs_signal.emit(list(self.songs))
+
     @pyqtSlot()
     def remove_song_from_playlist(self):
         '''do not call explicit, just a slot function'''
-        song = self.songs[self._context_menu_row]
-        if NPlaylistModel.del_song_from_playlist(song.mid, self._playlist_id):
-            self.removeRow(self._context_menu_row)
-            self.songs.pop(self._context_menu_row)
-            self._app.message('删除 %s 成功' % song.title)
+        rows = self.selected_rows()
+        if self._context_menu_row not in rows:
+            rows = [self._context_menu_row]
+        asyncio.Task(self.remove_songs_from_playlist(rows))
+
+    @asyncio.coroutine
+    def remove_songs_from_playlist(self, rows):
+        songs = list(self.songs)
+        removed = [songs[row] for row in rows]
+        pid = self._playlist_id
+        # rows are removed at once, and restored if request fails
+        for row in sorted(rows, reverse=True):
+            self.removeRow(row)
+            self.songs.pop(row)
+        event_loop = asyncio.get_event_loop()
+        ok = yield from event_loop.run_in_executor(
+            None, NPlaylistModel.del_songs_from_playlist,
+            [song.mid for song in removed], pid)
+        if ok:
+            self._app.message('删除 %d 首歌曲成功' % len(removed))
         else:
-            self._app.message('删除 %s 失败' % song.title, error=True)
+            self._app.message('删除 %d 首歌曲失败' % len(removed), error=True)
+            if self._playlist_id == pid:
+                self.set_songs(songs)
+
+    def selected_rows(self):
+        return sorted({index.row() for index in self.selectedIndexes()})
 
     def scroll_to_song(self, song):
         for i, s in enumerate(self.songs):
@@ -346,12 +380,24 @@ class SongsTable(MusicTable):
         self.setItem(row, 3, album_item)
         self.setItem(row, 4, length_item)
         cell_widget = _TagCellWidget(self._app)
-        if NSongModel.local_exists(song_model):
+        if self._local_mids is not None:
+            exists = song_model.mid in self._local_mids
+        else:
+            exists = NSongModel.local_exists(song_model)
+        if exists:
             cell_widget.set_download_tag()
         self.setCellWidget(row, 5, cell_widget)
 
         self.songs.append(song_model)
 
+    def set_songs(self, songs):
+        # check all songs against local index in one pass
+        self._local_mids = NSongModel.local_exists_many(songs)
+        super().set_songs(songs)
+        self._local_mids = None
+        # details of all songs of the table are got in a few requests
+        hydrator.request(songs)
+
     def _is_playlist_mine(self):
         if self.is_playlist():
             user = NUserModel.current_user
@@ -364,9 +410,11 @@ class SongsTable(MusicTable):
         add_to_current_playlist_action = QAction('添加到当前播放列表', self)
         set_song_next_to_action = QAction('下一首播放', self)
         download_song_action = QAction('下载该歌曲', self)
+        download_all_songs_action = QAction('下载全部歌曲', self)
         menu.addAction(add_to_current_playlist_action)
         menu.addAction(set_song_next_to_action)
         menu.addAction(download_song_action)
+        menu.addAction(download_all_songs_action)
 
         if self._is_playlist_mine():
             remove_song_from_playlist_action = QAction('从歌单中删除该歌曲', self)
@@ -379,6 +427,7 @@ class SongsTable(MusicTable):
         set_song_next_to_action.triggered.connect(
             self.set_song_to_next)
         download_song_action.triggered.connect(self.download_song)
+        download_all_songs_action.triggered.connect(self.download_all_songs)
 
         point = event.pos()
         item = self.itemAt(point)
@@ -393,6 +442,57 @@ class SongsTable(MusicTable):
             return self.songs[self._drag_row]
         return None
 
+    @property
+    def drag_songs(self):
+        '''selected songs, or the song under cursor if it is not selected'''
+        rows = self.selected_rows()
+        if self._drag_row is not None and self._drag_row not in rows:
+            rows = [self._drag_row]
+        return [self.songs[row] for row in rows]
+
+    def dragEnterEvent(self, event):
+        if event.source() is self and self._is_playlist_mine():
+            event.accept()
+        else:
+            event.ignore()
+
+    def dragMoveEvent(self, event):
+        if event.source() is self:
+            event.accept()
+
+    def dropEvent(self, event):
+        '''reorder songs of my playlist by dragging them'''
+        if event.source() is not self or not self._is_playlist_mine():
+            event.ignore()
+            return
+        # rows are rebuilt by us, so the default row moving is skipped
+        event.setDropAction(Qt.IgnoreAction)
+        event.accept()
+        row = self.rowAt(event.pos().y())
+        if row < 0:
+            row = len(self.songs)
+        asyncio.Task(self.move_songs(self.drag_songs, row))
+
+    @asyncio.coroutine
+    def move_songs(self, moved, row):
+        songs = list(self.songs)
+        pid = self._playlist_id
+        playlist = NPlaylistModel.get_playlist(pid)
+        if playlist is None or not moved:
+            return
+        moved_mids = {song.mid for song in moved}
+        rest = [song for song in songs if song.mid not in moved_mids]
+        index = len([song for song in songs[:row]
+                     if song.mid not in moved_mids])
+        self.set_songs(rest[:index] + moved + rest[index:])
+        event_loop = asyncio.get_event_loop()
+        ok = yield from event_loop.run_in_executor(
+            None, playlist.move_songs, list(moved_mids), row)
+        if not ok:
+            self._app.message('调整歌曲顺序失败', error=True)
+            if self._playlist_id == pid:
+                self.set_songs(songs)
+
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
         point = event.pos()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer
+
+from .config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class PositionBroadcaster(QObject):
+    """deliver player position to its listeners at a limited rate
+
+    mpv reports position many times per second in its own thread. Player
+    only records the latest value and it is polled here by a timer, so
+    intermediate values are coalesced and no cross-thread signal is
+    queued. The timer only runs while some holder, e.g. a visible window,
+    needs the position.
+    """
+    position_changed = pyqtSignal([int])
+
+    def __init__(self, app, resolution=1000):
+        super().__init__(app)
+        self._app = app
+        self._resolution = resolution  # ms, smaller changes are dropped
+        self._holders = set()
+        self._last_value = None
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(config.position_update_interval)
+        self._timer.timeout.connect(self._broadcast)
+
+    @property
+    def interval(self):
+        return self._timer.interval()
+
+    def set_interval(self, ms):
+        self._timer.setInterval(ms)
+
+    @property
+    def suspended(self):
+        return not self._timer.isActive()
+
+    def acquire(self, holder):
+        self._holders.add(holder)
+        if self.suspended:
+            logger.debug('resume position broadcasting')
+            # listeners may have missed values while suspended
+            self._last_value = None
+            self._broadcast()
+            self._timer.start()
+
+    def release(self, holder):
+        self._holders.discard(holder)
+        if not self._holders and not self.suspended:
+            logger.debug('suspend position broadcasting')
+            self._timer.stop()
+
+    def _broadcast(self):
+        ms = self._app.player.position_ms
+        value = ms // self._resolution
+        if value == self._last_value:
+            return
+        self._last_value = value
+        self.position_changed.emit(ms)
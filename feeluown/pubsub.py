@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from collections import deque, OrderedDict
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class Topic(object):
+    def __init__(self, name, snapshot=None, coalesce=False,
+                 activate=None, deactivate=None):
+        self.name = name
+        self.snapshot = snapshot    # returns current value of the topic
+        self.coalesce = coalesce    # only the latest value matters
+        self.activate = activate    # called when first subscriber comes
+        self.deactivate = deactivate    # called when last one leaves
+        self.subscribers = set()
+
+
+class Subscriber(object):
+    """events waiting to be sent to one client
+
+    Publishing only puts events into the subscriber, it never waits. They
+    are sent by the subscriber's own task, at most once per ``interval``,
+    so events published meanwhile go out in one write. While the client is
+    slow, at most ``MAX_QUEUE`` events are kept and older ones are dropped;
+    for coalesced topics such as position, only the latest value is kept.
+    """
+    MAX_QUEUE = 100
+
+    def __init__(self, send, interval):
+        """
+        :param send: coroutine function which writes bytes to the client
+        :param interval: minimum seconds between two writes
+        """
+        self._send = send
+        self._interval = interval
+        self._queue = deque()
+        self._latest = OrderedDict()    # topic -> data
+        self._dropped = 0
+        self._wakeup = asyncio.Event()
+        self.topics = set()
+        self._task = asyncio.Task(self._run())
+
+    def push(self, topic, data, coalesce=False):
+        if coalesce:
+            self._latest[topic] = data
+        else:
+            if len(self._queue) >= self.MAX_QUEUE:
+                self._queue.popleft()
+                self._dropped += 1
+            self._queue.append((topic, data))
+        self._wakeup.set()
+
+    def _take(self):
+        events = list(self._queue)
+        events.extend(self._latest.items())
+        self._queue.clear()
+        self._latest.clear()
+        if self._dropped:
+            events.insert(0, ('dropped', self._dropped))
+            self._dropped = 0
+        return events
+
+    @asyncio.coroutine
+    def _run(self):
+        while True:
+            yield from self._wakeup.wait()
+            self._wakeup.clear()
+            events = self._take()
+            try:
+                # waits while the client does not read, events which come
+                # meanwhile are coalesced or dropped
+                yield from self._send(events)
+            except ConnectionError:
+                break
+            yield from asyncio.sleep(self._interval)
+
+    def close(self):
+        self._task.cancel()
+
+
+class Publisher(object):
+    """deliver events of topics to subscribers
+
+    It must be used in the event loop thread.
+    """
+    def __init__(self):
+        self._topics = {}   # name -> Topic
+
+    def add_topic(self, name, **kwargs):
+        self._topics[name] = Topic(name, **kwargs)
+
+    @property
+    def topics(self):
+        return sorted(self._topics)
+
+    def subscribe(self, subscriber, names):
+        """subscribe topics, current values of them are sent at once
+
+        :raise KeyError: a topic does not exist
+        """
+        topics = [self._topics[name] for name in names]
+        for topic in topics:
+            if subscriber in topic.subscribers:
+                continue
+            topic.subscribers.add(subscriber)
+            subscriber.topics.add(topic.name)
+            if len(topic.subscribers) == 1 and topic.activate is not None:
+                topic.activate()
+            if topic.snapshot is not None:
+                subscriber.push(topic.name, topic.snapshot(), topic.coalesce)
+
+    def unsubscribe(self, subscriber, names=None):
+        """unsubscribe topics, all topics if names is None"""
+        if names is None:
+            names = list(subscriber.topics)
+        for name in names:
+            topic = self._topics.get(name)
+            if topic is None or subscriber not in topic.subscribers:
+                continue
+            topic.subscribers.discard(subscriber)
+            subscriber.topics.discard(name)
+            if not topic.subscribers and topic.deactivate is not None:
+                topic.deactivate()
+
+    def publish(self, name, data):
+        topic = self._topics[name]
+        for subscriber in topic.subscribers:
+            subscriber.push(name, data, topic.coalesce)
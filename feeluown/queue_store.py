@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import logging
+import os
+
+from .consts import QUEUE_FILE, PlaybackMode
+
+
+logger = logging.getLogger(__name__)
+
+
+def song_to_record(song, extra=None):
+    """compact form of a song: only id and fields needed to display it"""
+    record = [song.source, song.mid, song.title, song.artists_name,
+              song.album_name, song.length]
+    if extra:
+        record.append(extra)
+    return record
+
+
+def record_to_data(record):
+    source, mid, title, artists_name, album_name, length = record[:6]
+    data = dict(mid=mid, title=title, artists_name=artists_name,
+                album_name=album_name, length=length)
+    if len(record) > 6:
+        data.update(record[6])
+    return source, data
+
+
+class QueueStore(object):
+    """persist play queue and playback state in an append-only journal
+
+    Every queue change is a small json line appended to the journal, lines
+    are buffered and written at most once per ``DEBOUNCE`` seconds. The
+    journal is compacted into a snapshot when it grows too long.
+
+    Songs are restored from their records without network: every source
+    registers a factory which builds a song model from the record, and
+    song urls are resolved lazily when they are played.
+    """
+    DEBOUNCE = 1
+    MIN_COMPACT_LINES = 200
+
+    def __init__(self, app, path=QUEUE_FILE):
+        self._app = app
+        self._path = path
+
+        self._factories = {}    # source -> factory
+        self._serializers = {}  # source -> serializer
+        self._buffer = []
+        self._state_dirty = False
+        self._lines = 0
+        self._flush_handle = None
+
+    def register(self, source, factory, serializer=None):
+        """
+        :param factory: build a song model from a dict which has keys
+            mid, title, artists_name, album_name, length, and extra keys
+            returned by serializer
+        :param serializer: return a dict of extra fields of a song
+        """
+        self._factories[source] = factory
+        if serializer is not None:
+            self._serializers[source] = serializer
+
+    def _record(self, song):
+        serializer = self._serializers.get(song.source)
+        extra = serializer(song) if serializer is not None else None
+        return song_to_record(song, extra)
+
+    def reset(self, songs):
+        self._buffer = [{'op': 'reset'}]
+        self._lines = 0
+        for song in songs:
+            self.append(song)
+        self._state_dirty = True
+
+    def insert(self, index, song):
+        self._push({'op': 'insert', 'index': index,
+                    'song': self._record(song)})
+
+    def append(self, song):
+        self._push({'op': 'append', 'song': self._record(song)})
+
+    def remove(self, mid):
+        self._push({'op': 'remove', 'mid': mid})
+
+    def update_state(self):
+        """current song or playback mode changed"""
+        self._state_dirty = True
+        self._schedule_flush()
+
+    def _push(self, op):
+        self._buffer.append(op)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is not None:
+            return
+        event_loop = asyncio.get_event_loop()
+        self._flush_handle = event_loop.call_later(self.DEBOUNCE, self.flush)
+
+    def _state_op(self):
+        player = self._app.player
+        song = player.current_song
+        mode = player.last_playback_mode if player._other_mode \
+            else player.playback_mode
+        return {'op': 'state',
+                'mid': song.mid if song is not None else None,
+                'mode': mode.name,
+                'position': player.position_ms}
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._state_dirty:
+            self._buffer.append(self._state_op())
+            self._state_dirty = False
+        if not self._buffer:
+            return
+
+        ops, self._buffer = self._buffer, []
+        if ops[0]['op'] == 'reset':
+            # the whole queue is replaced, old lines are useless
+            self._write(ops, 'w')
+            self._lines = len(ops)
+        else:
+            self._write(ops, 'a')
+            self._lines += len(ops)
+        if self._lines > max(self.MIN_COMPACT_LINES,
+                             2 * len(self._app.player.songs)):
+            self.compact()
+
+    def compact(self):
+        """rewrite the journal as a snapshot of current queue"""
+        ops = [{'op': 'reset'}]
+        ops.extend({'op': 'append', 'song': self._record(song)}
+                   for song in self._app.player.songs)
+        ops.append(self._state_op())
+        self._write(ops, 'w')
+        self._lines = len(ops)
+        logger.debug('compact queue journal, %d songs' % (len(ops) - 2))
+
+    def _write(self, ops, mode):
+        text = ''.join(json.dumps(op, ensure_ascii=False,
+                                  separators=(',', ':')) + '\n'
+                       for op in ops)
+        try:
+            if mode == 'w':
+                tmp_path = self._path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_path, self._path)
+            else:
+                with open(self._path, 'a', encoding='utf-8') as f:
+                    f.write(text)
+        except OSError:
+            logger.exception('write queue journal failed')
+
+    def _replay(self):
+        records = []
+        state = None
+        lines = 0
+        broken = False
+        with open(self._path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    # the last line may be cut off when app is killed
+                    logger.warning('queue journal is broken at line %d'
+                                   % (lines + 1))
+                    broken = True
+                    break
+                lines += 1
+                name = op['op']
+                if name == 'reset':
+                    records = []
+                elif name == 'append':
+                    records.append(op['song'])
+                elif name == 'insert':
+                    records.insert(op['index'], op['song'])
+                elif name == 'remove':
+                    records = [r for r in records if r[1] != op['mid']]
+                elif name == 'state':
+                    state = op
+        return records, state, lines, broken
+
+    def restore(self):
+        """restore queue, it should be called after plugins are loaded"""
+        if not os.path.exists(self._path):
+            return False
+        try:
+            records, state, self._lines, broken = self._replay()
+        except (OSError, KeyError, IndexError):
+            logger.exception('read queue journal failed')
+            return False
+
+        songs = []
+        for record in records:
+            source, data = record_to_data(record)
+            factory = self._factories.get(source)
+            if factory is None:
+                continue
+            try:
+                songs.append(factory(data))
+            except Exception:
+                logger.exception('restore song %s failed' % data['mid'])
+
+        index, mode, position = None, PlaybackMode.loop, 0
+        if state is not None:
+            mode = PlaybackMode[state['mode']]
+            position = state['position']
+            for i, song in enumerate(songs):
+                if song.mid == state['mid']:
+                    index = i
+                    break
+        self._app.player.restore_queue(songs, index, mode, position)
+        if broken:
+            # lines appended after a broken line can not be read
+            self.compact()
+        logger.info('restore %d songs in queue' % len(songs))
+        return True
+
+    def close(self):
+        self._state_dirty = True
+        self.flush()
@@ -17,13 +17,15 @@ class Request(QObject):
     def __init__(self, app):
         super().__init__(parent=app)
         self._app = app
+        # connections are kept alive and shared, e.g. by download workers
+        self._session = requests.Session()
 
     def get(self, *args, **kw):
         logger.info('request.get %s %s' % (args, kw))
         if kw.get('timeout') is None:
             kw['timeout'] = 3
         try:
-            res = requests.get(*args, **kw)
+            res = self._session.get(*args, **kw)
             self.connected_signal.emit()
             return res
         except ConnectionError:
@@ -37,7 +39,7 @@ class Request(QObject):
     def post(self, *args, **kw):
         logger.info('request.post %s %s' % (args, kw))
         try:
-            res = requests.post(*args, **kw)
+            res = self._session.post(*args, **kw)
             return res
         except ConnectionError:
             self.disconnected_signal.emit()
@@ -1,63 +1,482 @@
+
 import asyncio
+import inspect
+import json
 import logging
-import socketserver
+import os
+import socket
+from functools import partial
+
+from PyQt5.QtCore import QObject
+from PyQt5.QtMultimedia import QMediaPlayer
+from fuocore.core.player import State
 
-from PyQt5.QtCore import QObject, pyqtSignal
+from .config import config
+from .consts import SOCKET_FILE, PlaybackMode
+from .pubsub import Publisher, Subscriber
 
 logger = logging.getLogger(__name__)
 
 
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+# plain text commands understood by the old udp server
+LEGACY_COMMANDS = {
+    'play': 'play',
+    'pause': 'pause',
+    'next': 'next',
+    'previous': 'previous',
+    'play_pause': 'play_pause',
+}
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def song_to_dict(song):
+    return {
+        'source': song.source,
+        'mid': song.mid,
+        'title': song.title,
+        'artists_name': song.artists_name,
+        'album_name': song.album_name,
+        'length': song.length,
+    }
+
+
+def _error(code, message, id_=None):
+    return {'jsonrpc': '2.0', 'id': id_,
+            'error': {'code': code, 'message': message}}
+
+
+STATE_NAMES = {
+    QMediaPlayer.PlayingState: 'playing',
+    QMediaPlayer.PausedState: 'paused',
+    QMediaPlayer.StoppedState: 'stopped',
+}
+
+
+class Connection(object):
+    """a client connection, responses and events share its writer"""
+    def __init__(self, writer):
+        self.writer = writer
+        self.subscriber = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def closed(self):
+        return self.writer.transport.is_closing()
+
+    @asyncio.coroutine
+    def send(self, data):
+        if self.closed:
+            raise ConnectionResetError('connection is closed')
+        yield from self._lock.acquire()
+        try:
+            self.writer.write(data)
+            yield from self.writer.drain()
+        finally:
+            self._lock.release()
+
+    @asyncio.coroutine
+    def send_events(self, events):
+        lines = [json.dumps({'jsonrpc': '2.0', 'method': 'event',
+                             'params': {'topic': topic, 'data': data}},
+                            ensure_ascii=False) + '\n'
+                 for topic, data in events]
+        yield from self.send(''.join(lines).encode('utf-8'))
+
+
 class Server(QObject):
-    play_signal = pyqtSignal()
-    pause_signal = pyqtSignal()
-    play_or_pause_signal = pyqtSignal()
-    play_next_signal = pyqtSignal()
-    play_previous_signal = pyqtSignal()
+    """control server speaking newline delimited JSON-RPC 2.0
+
+    It listens on a local tcp port and a unix socket, in the app event
+    loop. Each line is a request object or a batch (array) of them.
+    Requests of one connection are dispatched in the order they arrive
+    and responses are written in the same order, so a client can send
+    many requests without waiting for replies; coroutine methods such as
+    search run concurrently meanwhile. Plain text lines are the legacy
+    commands, they are answered with ``OK`` or ``Oops``.
+
+    Plugins add methods by :meth:`register`, by convention named with
+    their source as prefix, e.g. ``netease.search``.
+
+    A client calls ``subscribe`` with a list of topics to receive events as
+    ``event`` notifications, see :class:`feeluown.pubsub.Subscriber` for
+    how a slow client is handled.
+    """
+    MAX_PENDING = 32    # requests of one connection waiting for reply
 
     def __init__(self, app):
         super().__init__(app)
         self._app = app
+        self._methods = {}  # name -> function
+        # methods which take the connection as first argument
+        self._connection_methods = {
+            'subscribe': self.subscribe,
+            'unsubscribe': self.unsubscribe,
+        }
+        self._servers = []
+        self.publisher = Publisher()
+
+        self._register_builtin()
+        self._init_topics()
+
+    def register(self, name, func):
+        """register a method, func can be a function or coroutine function
+
+        Positional params are passed as arguments and named params as
+        keyword arguments. The return value must be json serializable.
+        """
+        self._methods[name] = func
+
+    def unregister(self, name):
+        self._methods.pop(name, None)
+
+    def _register_builtin(self):
+        player = self._app.player
+        self.register('play', self.play)
+        self.register('pause', player.pause)
+        self.register('play_pause', player.play_or_pause)
+        self.register('stop', player.stop)
+        self.register('next', player.play_next)
+        self.register('previous', player.play_last)
+        self.register('seek', self.seek)
+        self.register('volume', self.volume)
+        self.register('mode', self.mode)
+        self.register('status', self.status)
+        self.register('search', self.search)
+        self.register('queue.list', self.queue_list)
+        self.register('queue.play', self.queue_play)
+        self.register('queue.remove', self.queue_remove)
+        self.register('queue.clear', player.clear_playlist)
+        self.register('methods', lambda: sorted(
+            set(self._methods) | set(self._connection_methods)))
+        self.register('topics', lambda: self.publisher.topics)
+
+    def _init_topics(self):
+        player = self._app.player
+        broadcaster = self._app.position_broadcaster
+        self.publisher.add_topic(
+            'player.song', snapshot=lambda: self._song_data(
+                player.current_song))
+        self.publisher.add_topic(
+            'player.state', coalesce=True,
+            snapshot=lambda: player.player.state.name)
+        self.publisher.add_topic(
+            'player.mode', coalesce=True,
+            snapshot=lambda: player.playback_mode.name)
+        # position is only broadcast while someone needs it
+        self.publisher.add_topic(
+            'player.position', coalesce=True,
+            snapshot=lambda: player.position_ms,
+            activate=partial(broadcaster.acquire, self),
+            deactivate=partial(broadcaster.release, self))
+
+        self.publisher.add_topic(
+            'player.lyric', coalesce=True,
+            snapshot=lambda: self._lyric_data(
+                *self._app.lyric_manager.current_line()))
+
+        # handlers are methods of this QObject, so they are called in
+        # main thread even if signals are emitted in player thread
+        player.signal_player_song_changed.connect(self._on_song_changed)
+        player.stateChanged.connect(self._on_state_changed)
+        player.signal_playback_mode_changed.connect(self._on_mode_changed)
+        broadcaster.position_changed.connect(self._on_position_changed)
+        self._app.lyric_manager.line_changed.connect(self._on_lyric_changed)
+
+    def _song_data(self, song):
+        return None if song is None else song_to_dict(song)
+
+    def _on_song_changed(self, song):
+        self.publisher.publish('player.song', self._song_data(song))
+
+    def _on_state_changed(self, state):
+        self.publisher.publish('player.state', STATE_NAMES.get(state))
+
+    def _on_mode_changed(self, mode):
+        self.publisher.publish('player.mode', mode.name)
+
+    def _on_position_changed(self, ms):
+        self.publisher.publish('player.position', ms)
 
-        self.play_signal.connect(self._app.player.play)
-        self.pause_signal.connect(self._app.player.pause)
-        self.play_or_pause_signal.connect(self._app.player.play_or_pause)
-        self.play_next_signal.connect(self._app.player.play_next)
-        self.play_previous_signal.connect(self._app.player.play_last)
+    def _lyric_data(self, line, translation):
+        return {'line': line, 'translation': translation}
+
+    def _on_lyric_changed(self, line, translation):
+        self.publisher.publish('player.lyric',
+                               self._lyric_data(line, translation))
 
     def run(self):
-        host = '0.0.0.0'
-        port = 8000
+        asyncio.Task(self._start())
+
+    @asyncio.coroutine
+    def _start(self):
+        host, port = config.server_host, config.server_port
         try:
-            self.server = socketserver.UDPServer((host, port), Handler)
+            server = yield from asyncio.start_server(
+                self._handle_connection, host, port)
         except OSError:
-            logger.error('udp %d port already in use' % port)
-            return
+            logger.error('tcp %d port already in use' % port)
+        else:
+            self._servers.append(server)
+            logger.info('server run in %s:%d' % (host, port))
+            self._app.message('命令行服务运行于 %d 端口' % port)
 
-        self.server.ctrl = self
-        event_loop = asyncio.get_event_loop()
-        event_loop.run_in_executor(None,
-                                   self.server.serve_forever)
-        logger.info('server run in %d' % port)
-        self._app.message('命令行服务运行于 %d 端口' % port)
+        if not hasattr(socket, 'AF_UNIX'):
+            return
+        try:
+            # a socket file left by last run
+            if os.path.exists(SOCKET_FILE):
+                os.remove(SOCKET_FILE)
+            server = yield from asyncio.start_unix_server(
+                self._handle_connection, SOCKET_FILE)
+        except OSError as e:
+            logger.error('listen on %s failed: %s' % (SOCKET_FILE, e))
+        else:
+            self._servers.append(server)
+            logger.info('server run in %s' % SOCKET_FILE)
 
     def stop(self):
-        self.server.shutdown()
-
-
-class Handler(socketserver.BaseRequestHandler):
-    def handle(self):
-        self.data = self.request[0].strip()
-        logger.info('{} send: {}'.format(self.client_address[0], self.data))
-        command = self.data.decode('utf-8')
-        if command == 'play':
-            self.server.ctrl.play_signal.emit()
-        elif command == 'pause':
-            self.server.ctrl.pause_signal.emit()
-        elif command == 'next':
-            self.server.ctrl.play_next_signal.emit()
-        elif command == 'previous':
-            self.server.ctrl.play_previous_signal.emit()
-        elif command == 'play_pause':
-            self.server.ctrl.play_or_pause_signal.emit()
+        for server in self._servers:
+            server.close()
+        if self._servers and os.path.exists(SOCKET_FILE):
+            os.remove(SOCKET_FILE)
+        self._servers = []
+
+    @asyncio.coroutine
+    def _handle_connection(self, reader, writer):
+        conn = Connection(writer)
+        pending = asyncio.Queue(self.MAX_PENDING)
+        responder = asyncio.Task(self._respond(pending, conn))
+        try:
+            while True:
+                try:
+                    line = yield from reader.readline()
+                except ValueError:
+                    # line is longer than the stream limit
+                    response = _error(PARSE_ERROR, 'line too long')
+                    yield from pending.put(self._done(response))
+                    break
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    task = asyncio.Task(self.handle_line(line, conn))
+                    yield from pending.put(task)
+        except ConnectionError:
+            pass
+        finally:
+            if conn.subscriber is not None:
+                self.publisher.unsubscribe(conn.subscriber)
+                conn.subscriber.close()
+            yield from pending.put(None)
+            yield from responder
+
+    @asyncio.coroutine
+    def _respond(self, pending, conn):
+        while True:
+            task = yield from pending.get()
+            if task is None:
+                break
+            response = yield from task
+            if response is None or conn.closed:
+                continue
+            try:
+                yield from conn.send(response.encode('utf-8'))
+            except ConnectionError:
+                break
+        conn.writer.close()
+
+    def _done(self, response):
+        future = asyncio.Future()
+        future.set_result(json.dumps(response) + '\n')
+        return future
+
+    @asyncio.coroutine
+    def handle_line(self, line, conn=None):
+        """handle one line, return the response line or None"""
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        if not line.startswith(('{', '[')):
+            return (yield from self._handle_legacy(line))
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return json.dumps(_error(PARSE_ERROR, 'parse error')) + '\n'
+        if isinstance(data, list):
+            if not data:
+                response = _error(INVALID_REQUEST, 'empty batch')
+            else:
+                responses = yield from asyncio.gather(
+                    *[self._handle_request(item, conn) for item in data])
+                response = [r for r in responses if r is not None] or None
+        else:
+            response = yield from self._handle_request(data, conn)
+        if response is None:
+            return None
+        try:
+            return json.dumps(response, ensure_ascii=False) + '\n'
+        except TypeError as e:
+            logger.error('response of %s is invalid: %s' % (line, e))
+            return json.dumps(_error(INTERNAL_ERROR, 'invalid result')) + '\n'
+
+    @asyncio.coroutine
+    def _handle_legacy(self, line):
+        logger.info('receive legacy command: %s' % line)
+        method = LEGACY_COMMANDS.get(line)
+        if method is None:
+            logger.warning('command not found: %s' % line)
+            return 'Oops: command not found\n'
+        try:
+            yield from self.call(method)
+        except RpcError as e:
+            return 'Oops: %s\n' % e.message
+        return 'OK\n'
+
+    @asyncio.coroutine
+    def _handle_request(self, request, conn=None):
+        if not isinstance(request, dict) or \
+                not isinstance(request.get('method'), str):
+            return _error(INVALID_REQUEST, 'invalid request')
+        is_notification = 'id' not in request
+        id_ = request.get('id')
+        try:
+            result = yield from self.call(request['method'],
+                                          request.get('params'), conn)
+        except RpcError as e:
+            response = _error(e.code, e.message, id_)
         else:
-            logger.warning('command not found: %s' % command)
+            response = {'jsonrpc': '2.0', 'id': id_, 'result': result}
+        if is_notification:
+            return None
+        return response
+
+    @asyncio.coroutine
+    def call(self, method, params=None, conn=None):
+        func = self._methods.get(method)
+        if method in self._connection_methods and conn is not None:
+            func = partial(self._connection_methods[method], conn)
+        if func is None:
+            raise RpcError(METHOD_NOT_FOUND, 'method not found: %s' % method)
+        if params is None:
+            args, kwargs = [], {}
+        elif isinstance(params, list):
+            args, kwargs = params, {}
+        elif isinstance(params, dict):
+            args, kwargs = [], params
+        else:
+            raise RpcError(INVALID_REQUEST, 'params must be array or object')
+        try:
+            inspect.signature(func).bind(*args, **kwargs)
+        except TypeError as e:
+            raise RpcError(INVALID_PARAMS, str(e))
+        except ValueError:
+            pass    # signature of some builtins is unavailable
+        try:
+            result = func(*args, **kwargs)
+            if asyncio.iscoroutine(result) or isinstance(result,
+                                                         asyncio.Future):
+                result = yield from result
+        except RpcError:
+            raise
+        except Exception as e:
+            logger.exception('call %s failed' % method)
+            raise RpcError(INTERNAL_ERROR, str(e))
+        return result
+
+    def subscribe(self, conn, topics):
+        """subscribe topics, return all topics subscribed"""
+        if not isinstance(topics, list):
+            raise RpcError(INVALID_PARAMS, 'topics must be an array')
+        unknown = set(topics) - set(self.publisher.topics)
+        if unknown:
+            raise RpcError(INVALID_PARAMS,
+                           'unknown topics: %s' % ', '.join(sorted(unknown)))
+        if conn.subscriber is None:
+            conn.subscriber = Subscriber(conn.send_events,
+                                         config.server_event_interval)
+        self.publisher.subscribe(conn.subscriber, topics)
+        return sorted(conn.subscriber.topics)
+
+    def unsubscribe(self, conn, topics=None):
+        if conn.subscriber is None:
+            return []
+        self.publisher.unsubscribe(conn.subscriber, topics)
+        return sorted(conn.subscriber.topics)
+
+    def play(self, index=None):
+        player = self._app.player
+        if index is not None:
+            return self.queue_play(index)
+        if player.player.state != State.playing:
+            player.play_or_pause()
+
+    def seek(self, position):
+        """:param position: seconds"""
+        self._app.player.setPosition(position)
+
+    def volume(self, value=None):
+        player = self._app.player
+        if value is not None:
+            player.setVolume(value)
+        return player.player.volume
+
+    def mode(self, mode=None):
+        """get or set playback mode, mode is one of the enum names"""
+        player = self._app.player
+        if mode is not None:
+            if mode not in PlaybackMode.__members__:
+                raise RpcError(INVALID_PARAMS, 'unknown mode: %s' % mode)
+            player._set_playback_mode(PlaybackMode[mode])
+        return player.playback_mode.name
+
+    def status(self):
+        player = self._app.player
+        song = player.current_song
+        return {
+            'state': player.player.state.name,
+            'song': None if song is None else song_to_dict(song),
+            'position': player.position_ms,
+            'mode': player.playback_mode.name,
+            'queue_length': len(player.songs),
+            'bandwidth': self._app.bandwidth_scheduler.status(),
+        }
+
+    @asyncio.coroutine
+    def search(self, text):
+        """search in all sources which register a ``<source>.search``"""
+        names = [name for name in self._methods if name.endswith('.search')]
+        results = yield from asyncio.gather(
+            *[self.call(name, [text]) for name in names],
+            return_exceptions=True)
+        songs = []
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.error('%s failed: %s' % (name, result))
+                continue
+            songs.extend(result)
+        return songs
+
+    def queue_list(self):
+        return [song_to_dict(song) for song in self._app.player.songs]
+
+    def queue_play(self, index):
+        songs = self._app.player.songs
+        if not isinstance(index, int) or not 0 <= index < len(songs):
+            raise RpcError(INVALID_PARAMS, 'index out of range')
+        self._app.player.play(songs[index])
+
+    def queue_remove(self, mid):
+        if not any(song.mid == mid for song in self._app.player.songs):
+            raise RpcError(INVALID_PARAMS, 'song not in queue: %s' % mid)
+        self._app.player.remove_music(mid)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+
+class ShuffleOrder(object):
+    """non repeating random order of a queue
+
+    Every key is played once per round. The order is a lazily generated
+    permutation: the next key is drawn from the keys which are not played
+    in current round, so generating a step costs O(1) whatever the queue
+    length is. Played keys are kept in a history, which gives a real
+    "previous" and replays the same order when going forward again.
+
+    Keys may be added or removed at any time. With ``anti_clustering``,
+    a key of the same group (usually artist) as the previous one is
+    avoided whenever possible.
+    """
+    MAX_HISTORY = 1000
+    ANTI_CLUSTERING_TRIES = 8
+
+    def __init__(self, anti_clustering=False, rand=None):
+        self.anti_clustering = anti_clustering
+        self._random = rand or random.Random()
+
+        self._groups = {}   # key -> group
+        self._pool = []     # keys which are not played in current round
+        self._pool_pos = {}     # key -> index in pool
+        self._held = None   # key put back to pool after first draw of round
+        self._history = []
+        self._cursor = -1   # index of current key in history
+
+    def __len__(self):
+        return len(self._groups)
+
+    @property
+    def current(self):
+        if 0 <= self._cursor < len(self._history):
+            return self._history[self._cursor]
+        return None
+
+    def reset(self, items=()):
+        """:param items: iterable of ``(key, group)``"""
+        self._groups = dict(items)
+        self._pool = list(self._groups)
+        self._pool_pos = {key: i for i, key in enumerate(self._pool)}
+        self._held = None
+        self._history = []
+        self._cursor = -1
+
+    def add(self, key, group=None):
+        if key in self._groups:
+            return
+        self._groups[key] = group
+        self._pool_add(key)
+
+    def insert_next(self, key, group=None):
+        """add key and make it the next one"""
+        self._groups[key] = group
+        self._pool_remove(key)
+        if key == self._held:
+            self._held = None
+        self._history.insert(self._cursor + 1, key)
+
+    def remove(self, key):
+        if key not in self._groups:
+            return
+        del self._groups[key]
+        self._pool_remove(key)
+        # keys in history are skipped lazily once they are removed
+
+    def set_current(self, key):
+        """mark key as being played, e.g. it is chosen by user"""
+        if key == self.current or key not in self._groups:
+            return
+        self._pool_remove(key)
+        self._cursor += 1
+        # key may already be the next one, e.g. it is peeked or inserted
+        if self.current != key:
+            self._history.insert(self._cursor, key)
+        self._trim_history()
+
+    def peek_next(self):
+        """return next key without moving forward"""
+        index = self._next_history_index()
+        if index is None:
+            key = self._draw()
+            if key is None:
+                return None
+            self._history.append(key)
+            index = len(self._history) - 1
+        # drop removed keys between cursor and next key
+        del self._history[self._cursor + 1:index]
+        return self._history[self._cursor + 1]
+
+    def next(self):
+        key = self.peek_next()
+        if key is not None:
+            self._cursor += 1
+            self._trim_history()
+        return key
+
+    def previous(self):
+        index = self._cursor - 1
+        while index >= 0 and self._history[index] not in self._groups:
+            index -= 1
+        if index < 0:
+            return None
+        # drop removed keys between previous key and current key
+        del self._history[index + 1:self._cursor]
+        self._cursor = index
+        return self._history[index]
+
+    def _next_history_index(self):
+        for index in range(self._cursor + 1, len(self._history)):
+            if self._history[index] in self._groups:
+                return index
+        del self._history[self._cursor + 1:]
+        return None
+
+    def _draw(self):
+        if not self._pool:
+            self._new_round()
+            if not self._pool:
+                return None
+        index = self._random.randrange(len(self._pool))
+        if self.anti_clustering:
+            last_group = self._groups.get(self.current)
+            tries = 1
+            while last_group is not None and \
+                    self._groups[self._pool[index]] == last_group and \
+                    tries < self.ANTI_CLUSTERING_TRIES:
+                index = self._random.randrange(len(self._pool))
+                tries += 1
+        key = self._pool[index]
+        self._pool_remove(key)
+        held, self._held = self._held, None
+        if held is not None and held in self._groups:
+            self._pool_add(held)
+        return key
+
+    def _new_round(self):
+        current = self.current
+        for key in self._groups:
+            # do not repeat current key right at the start of new round,
+            # it joins the pool once another key is drawn
+            if key != current or len(self._groups) == 1:
+                self._pool_add(key)
+            else:
+                self._held = key
+
+    def _pool_add(self, key):
+        if key in self._pool_pos:
+            return
+        self._pool_pos[key] = len(self._pool)
+        self._pool.append(key)
+
+    def _pool_remove(self, key):
+        index = self._pool_pos.pop(key, None)
+        if index is None:
+            return
+        last = self._pool.pop()
+        if index < len(self._pool):
+            self._pool[index] = last
+            self._pool_pos[last] = index
+
+    def _trim_history(self):
+        overflow = len(self._history) - self.MAX_HISTORY
+        if overflow > 0 and self._cursor >= overflow:
+            del self._history[:overflow]
+            self._cursor -= overflow
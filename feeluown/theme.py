@@ -1,33 +1,95 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+from collections import OrderedDict
+from functools import partial
 import os
 import configparser
 import logging
 import random
 
-from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import QFileSystemWatcher
+from PyQt5.QtWidgets import QApplication, QWidget
 from PyQt5.QtGui import QColor
 
 from .consts import THEMES_DIR, USER_THEMES_DIR
+from .utils import measure_time
 
 
 logger = logging.getLogger(__name__)
 
+THEME_EXT = '.colorscheme'
+
 
 class ThemeManager(object):
-    def __init__(self, app):
+    '''
+    Theme directories are indexed once and watched for changes, so listing
+    themes never touches the filesystem. Themes are parsed in background
+    by :meth:`preload` and cached, a theme file is parsed again when it
+    is modified.
+    '''
+    def __init__(self, app, themes_dirs=(THEMES_DIR, USER_THEMES_DIR)):
         super().__init__()
         self._app = app
+        self._themes_dirs = themes_dirs
 
         self.current_theme = None
-        self._themes = []    # config file name (theme name)
-
+        self._themes = OrderedDict()    # theme name -> config file path
+        self._loaded_themes = {}    # theme name -> Theme
+
+        self._watcher = QFileSystemWatcher(app)
+        dirs = [d for d in themes_dirs if os.path.isdir(d)]
+        if dirs:
+            self._watcher.addPaths(dirs)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+
+        # theme name -> {(widget class, object name): stylesheet}
+        self._styles = {}
+        self._apply_handle = None
+        self.scan()
+
+    def add_style(self, widget, style_str):
+        '''add stylesheet of a widget to the app stylesheet
+
+        The stylesheet must be scoped by the object name of the widget, and
+        it should only depend on current theme. It is compiled once per
+        theme and widget class, and all of them are applied by one
+        ``QApplication.setStyleSheet`` call, which is much cheaper than
+        setting stylesheet on every widget.
+        '''
+        styles = self._styles.setdefault(self.current_theme.name,
+                                         OrderedDict())
+        key = (type(widget), widget.objectName())
+        if styles.get(key) == style_str:
+            return
+        styles[key] = style_str
+        if self._apply_handle is None:
+            event_loop = asyncio.get_event_loop()
+            self._apply_handle = event_loop.call_soon(self.apply)
+
+    def _has_style(self, widget):
+        styles = self._styles.get(self.current_theme.name, {})
+        return (type(widget), widget.objectName()) in styles
+
+    def apply(self):
+        '''apply app stylesheet of current theme'''
+        if self._apply_handle is not None:
+            self._apply_handle.cancel()
+            self._apply_handle = None
+        styles = self._styles.get(self.current_theme.name, {})
+        QApplication.instance().setStyleSheet(''.join(styles.values()))
+
+    @measure_time
     def choose(self, theme_name):
         '''
         :param theme: theme unique name
         '''
         def recursive_update(widget):
-            if hasattr(widget, 'set_theme_style'):
+            # widgets whose style is compiled for this theme are skipped,
+            # others set their own stylesheet
+            if hasattr(widget, 'set_theme_style') and \
+                    not self._has_style(widget):
                 widget.set_theme_style()
             for child in widget.children():
                 if isinstance(child, QWidget):
@@ -35,158 +97,211 @@ class ThemeManager(object):
 
         self.set_theme(theme_name)
         recursive_update(self._app)
-
-    def scan(self, themes_dir=[THEMES_DIR, USER_THEMES_DIR]):
-        '''themes directory'''
-        self._themes = []
-        for directory in themes_dir:
-            files = os.listdir(directory)
+        self.apply()
+
+    def scan(self):
+        '''index theme files, builtin themes take precedence'''
+        themes = OrderedDict()
+        for directory in self._themes_dirs:
+            try:
+                files = sorted(os.listdir(directory))
+            except OSError:
+                logger.warning('can not list themes dir %s' % directory)
+                continue
             for f in files:
-                f_name, f_ext = f.split('.')
-                if f_ext == 'colorscheme':
-                    self._themes.append(f_name)
+                f_name, f_ext = os.path.splitext(f)
+                if f_ext == THEME_EXT and f_name not in themes:
+                    themes[f_name] = os.path.join(directory, f)
+        self._themes = themes
+        # editors usually replace the file, watcher forgets it then
+        watched = set(self._watcher.files())
+        paths = [path for path in themes.values() if path not in watched]
+        if paths:
+            self._watcher.addPaths(paths)
+
+    def _on_directory_changed(self, directory):
+        logger.info('themes dir %s changed, rescan it' % directory)
+        old_themes = self._themes
+        self.scan()
+        for name in list(self._loaded_themes):
+            if name not in self._themes:
+                if self._loaded_themes[name] is not self.current_theme:
+                    del self._loaded_themes[name]
+            elif self._themes[name] != old_themes.get(name):
+                self._drop(name)
+        self._reload_current()
+        self.preload()
+
+    def _on_file_changed(self, path):
+        logger.info('theme file %s changed, parse it again' % path)
+        if os.path.exists(path) and path not in self._watcher.files():
+            self._watcher.addPath(path)
+        for name, theme_path in self._themes.items():
+            if theme_path == path:
+                self._drop(name)
+        self._reload_current()
+        self.preload()
+
+    def _drop(self, name):
+        '''forget parsed theme and styles compiled for it'''
+        self._loaded_themes.pop(name, None)
+        self._styles.pop(name, None)
+
+    def _reload_current(self):
+        current = self.current_theme
+        if current is not None and \
+                current.name not in self._loaded_themes and \
+                current.name in self._themes:
+            self.choose(current.name)
+
+    def preload(self):
+        '''parse themes which are not loaded in background'''
+        event_loop = asyncio.get_event_loop()
+        for name, path in self._themes.items():
+            if name in self._loaded_themes:
+                continue
+            future = event_loop.run_in_executor(None, Theme, name, path)
+            future.add_done_callback(partial(self._on_theme_parsed, name))
+
+    def _on_theme_parsed(self, name, future):
+        try:
+            theme = future.result()
+        except Exception:
+            logger.exception('parse theme %s failed' % name)
+            return
+        self._loaded_themes.setdefault(name, theme)
 
     def list(self):
         '''show themes list
 
-        :param theme: theme unique name
         :return: themes name list
         '''
-        if not self._themes:
-            self.scan()
-        return self._themes
+        return list(self._themes)
 
     def get_theme(self, theme_name):
         '''
         :param theme: unique theme name
         :return: `Theme` object
         '''
-        pass
+        if theme_name not in self._loaded_themes:
+            self._loaded_themes[theme_name] = Theme(
+                theme_name, self._themes.get(theme_name))
+        return self._loaded_themes[theme_name]
 
     def set_theme(self, theme_name):
         '''set current theme'''
-        self.current_theme = Theme(theme_name)
+        self.current_theme = self.get_theme(theme_name)
 
 
 class Theme(object):
-    def __init__(self, config_name=None):
+    '''colors of a theme, they are parsed once when theme is read
+
+    Colors are shared, so do not modify them.
+    '''
+    def __init__(self, config_name=None, path=None):
         self._config = configparser.ConfigParser()
         self.name = config_name
+        self._palette = {}  # section name -> QColor
 
-        self.read(config_name)
+        self.read(config_name, path)
 
-    def read(self, config_file):
+    def read(self, config_file, path=None):
         if config_file is not None:
-            config_file_path = os.path.abspath(THEMES_DIR + '/' + config_file +
-                                               '.colorscheme')
+            config_file_path = path
+            if config_file_path is None:
+                config_file_path = os.path.abspath(
+                    THEMES_DIR + '/' + config_file + THEME_EXT)
             if not os.path.exists(config_file_path):
                 config_file_path = os.path.abspath(
-                    USER_THEMES_DIR + '/' + config_file + '.colorscheme')
-                print('........ %s ............' % config_file_path)
+                    USER_THEMES_DIR + '/' + config_file + THEME_EXT)
             config = self._config.read(config_file_path)
             if config:
+                self._palette = {
+                    name: self._parse_color_str(section['color'])
+                    for name, section in self._config.items()
+                    if 'color' in section}
                 return True
         return False
 
     @property
     def background_light(self):
-        color_section = self._config['Background']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Background']
 
     @property
     def background(self):
-        color_section = self._config['BackgroundIntense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['BackgroundIntense']
 
     @property
     def foreground_light(self):
-        color_section = self._config['Foreground']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Foreground']
 
     @property
     def foreground(self):
-        color_section = self._config['ForegroundIntense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['ForegroundIntense']
 
     @property
     def color0_light(self):
-        color_section = self._config['Color0']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color0']
 
     @property
     def color0(self):
-        color_section = self._config['Color0Intense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color0Intense']
 
     @property
     def color1_light(self):
-        color_section = self._config['Color1']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color1']
 
     @property
     def color1(self):
-        color_section = self._config['Color1Intense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color1Intense']
 
     @property
     def color2_light(self):
-        color_section = self._config['Color2']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color2']
 
     @property
     def color2(self):
-        color_section = self._config['Color2Intense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color2Intense']
 
     @property
     def color3_light(self):
-        color_section = self._config['Color3']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color3']
 
     @property
     def color3(self):
-        color_section = self._config['Color3Intense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color3Intense']
 
     @property
     def color4_light(self):
-        color_section = self._config['Color4']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color4']
 
     @property
     def color4(self):
-        color_section = self._config['Color4Intense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color4Intense']
 
     @property
     def color5_light(self):
-        color_section = self._config['Color5']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color5']
 
     @property
     def color5(self):
-        color_section = self._config['Color5Intense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color5Intense']
 
     @property
     def color6_light(self):
-        color_section = self._config['Color6']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color6']
 
     @property
     def color6(self):
-        color_section = self._config['Color6Intense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color6Intense']
 
     @property
     def color7_light(self):
-        color_section = self._config['Color7']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color7']
 
     @property
     def color7(self):
-        color_section = self._config['Color7Intense']
-        return self._parse_color_str(color_section['color'])
+        return self._palette['Color7Intense']
 
     def random_color(self):
         '''return one of the eight*2 color'''
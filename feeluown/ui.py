@@ -43,7 +43,7 @@ class PlayerControlButton(FButton):
         '''.format(self.objectName(),
                    theme.foreground.name(),
                    theme.color4.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
 
 class ProgressSlider(_BasicSlider):
@@ -149,7 +149,7 @@ class PlayerControlPanel(FFrame):
         '''.format(self.objectName(),
                    theme.foreground.name(),
                    theme.color0.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         self._btn_container.setFixedWidth(140)
@@ -205,7 +205,7 @@ class TopPanel(FFrame):
                    theme.foreground.name(),
                    theme.color0_light.name(),
                    theme.color0_light.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         self.setFixedHeight(60)
@@ -236,7 +236,7 @@ class LP_LibraryPanel(FFrame):
             }}
         '''.format(self.objectName(),
                    theme.color3.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         self._layout.addSpacing(3)
@@ -267,11 +267,15 @@ class LP_PlaylistsPanel(FFrame):
             }}
         '''.format(self.objectName(),
                    theme.color5.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def add_item(self, item):
         self._layout.addWidget(item)
 
+    def remove_item(self, item):
+        self._layout.removeWidget(item)
+        item.deleteLater()
+
     def setup_ui(self):
         self._layout.setContentsMargins(0, 0, 0, 0)
         self._layout.setSpacing(0)
@@ -301,7 +305,7 @@ class LeftPanel(FFrame):
             }}
         '''.format(self.objectName(),
                    theme.color5.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         self._layout.addWidget(self.library_panel)
@@ -339,7 +343,7 @@ class LeftPanel_Container(FScrollArea):
             }}
         '''.format(self.objectName(),
                    theme.color0_light.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         pass
@@ -364,7 +368,7 @@ class RightPanel(FFrame):
                 padding: 20px 30px 0px 30px;
             }}
         '''.format(self.objectName())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def set_widget(self, widget):
         if self.widget and self.widget != widget:
@@ -390,7 +394,7 @@ class RightPanel_Container(FScrollArea):
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setWidgetResizable(True)
 
-        self.setObjectName('c_left_panel')
+        self.setObjectName('c_right_panel_container')
         self.set_theme_style()
         self.setup_ui()
 
@@ -403,7 +407,7 @@ class RightPanel_Container(FScrollArea):
             }}
         '''.format(self.objectName(),
                    theme.color5.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         self._layout.setContentsMargins(0, 0, 0, 0)
@@ -421,6 +425,7 @@ class CentralPanel(FFrame):
         self.right_panel = self.right_panel_container.right_panel
 
         self._layout = FHBoxLayout(self)
+        self.setObjectName('central_panel')
         self.set_theme_style()
         self.setup_ui()
 
@@ -430,7 +435,7 @@ class CentralPanel(FFrame):
                 background: transparent;
             }}
         '''.format(self.objectName())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         self._layout.addWidget(self.left_panel_container)
@@ -481,7 +486,7 @@ class PlaybackModeSwitchBtn(FButton):
         '''.format(self.objectName(),
                    theme.color6.name(),
                    theme.background.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def set_text(self, text):
         self.setText('♭ ' + text)
@@ -534,7 +539,7 @@ class ThemeCombo(FComboBox):
                    theme.color4.name(),
                    theme.background.name(),
                    theme.foreground.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     @pyqtSlot(int)
     def on_index_changed(self, index):
@@ -762,7 +767,7 @@ class AppStatusLabel(FLabel):
                    theme.color4.name(),
                    theme.color2.name(),
                    theme.background.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton and \
@@ -872,7 +877,7 @@ class StatusPanel(FFrame):
             }}
         '''.format(self.objectName(),
                    theme.color0.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         self.setFixedHeight(18)
@@ -886,7 +891,7 @@ class StatusPanel(FFrame):
 
 
 class CurrentPlaylistTable(MusicTable):
-    remove_signal = pyqtSignal([int])   # song id
+    remove_signal = pyqtSignal([object])    # song id
 
     def __init__(self, app):
         super().__init__(app)
@@ -920,6 +925,58 @@ class LyricFrame(FFrame):
         super().__init__(parent)
         self._app = app
 
+        self._layout = FVBoxLayout(self)
+        self.line_label = FLabel(self)
+        self.translation_label = FLabel(self)
+
+        self.setup_ui()
+        self.setObjectName('lyric_frame')
+        self.set_theme_style()
+
+        lyric_manager = self._app.lyric_manager
+        lyric_manager.lyric_changed.connect(self.on_lyric_changed)
+        lyric_manager.line_changed.connect(self.on_line_changed)
+
+    def set_theme_style(self):
+        theme = self._app.theme_manager.current_theme
+        style_str = '''
+            #{0} {{
+                background: {1};
+            }}
+            #{0} QLabel {{
+                color: {2};
+                font-size: 14px;
+            }}
+            #{0} #lyric_translation_label {{
+                color: {3};
+                font-size: 12px;
+            }}
+        '''.format(self.objectName(),
+                   theme.background.name(),
+                   theme.foreground_light.name(),
+                   theme.color7.name())
+        self._app.theme_manager.add_style(self, style_str)
+
+    def setup_ui(self):
+        self.setFixedHeight(44)
+        self.translation_label.setObjectName('lyric_translation_label')
+        for label in (self.line_label, self.translation_label):
+            label.setAlignment(Qt.AlignCenter)
+            self._layout.addWidget(label)
+        self.hide()
+
+    def on_lyric_changed(self):
+        if self._app.lyric_manager.lyric is None:
+            self.hide()
+        else:
+            self.on_line_changed(*self._app.lyric_manager.current_line())
+            self.show()
+
+    def on_line_changed(self, line, translation):
+        self.line_label.setText(line)
+        self.translation_label.setText(translation)
+        self.translation_label.setVisible(bool(translation))
+
 
 class Ui(object):
     def __init__(self, app):
@@ -928,11 +985,13 @@ class Ui(object):
         self.central_panel = CentralPanel(app, app)
         self.status_panel = StatusPanel(app, app)
         self.status_panel.hide()
+        self.lyric_frame = LyricFrame(app, app)
         self.current_playlist_table = CurrentPlaylistTable(app)
 
         self.setup()
 
     def setup(self):
         self._layout.addWidget(self.central_panel)
+        self._layout.addWidget(self.lyric_frame)
         self._layout.addWidget(self.top_panel)
         self._layout.addWidget(self.status_panel)
@@ -1,4 +1,5 @@
 import logging
+import os
 import platform
 import time
 from functools import wraps
@@ -59,20 +60,47 @@ def is_osx():
     return False
 
 
-def emit_requests_progress(response, signal=None):
-    content = bytes()
-    total_size = response.headers.get('content-length')
-    if total_size is None:
-        content = response.content
-        return content
+def stream_to_file(response, f_path, offset=0, callback=None,
+                   throttle=None, chunk_size=102400):
+    """write response body to ``f_path`` chunk by chunk
+
+    The body is streamed into ``f_path + '.part'``, which is fsynced and
+    then atomically renamed to ``f_path``, so ``f_path`` either does not
+    exist or is complete. Memory usage does not depend on the file size.
+
+    :param offset: bytes already in the part file, the response is then
+                   expected to be a ranged one which starts at ``offset``
+    :param callback: called with ``(bytes_so_far, total_size)`` after
+                     each chunk, ``total_size`` may be None
+    :param throttle: called with chunk size before the chunk is written,
+                     it may block to limit the download rate
+    :return: the size of the file
+    """
+    content_length = response.headers.get('content-length')
+    if content_length is not None:
+        total_size = int(content_length) + offset
     else:
-        total_size = int(total_size)
-        bytes_so_far = 0
-
-        for chunk in response.iter_content(102400):
-            content += chunk
+        total_size = None
+    tmp_path = f_path + '.part'
+    bytes_so_far = offset
+    with open(tmp_path, 'ab' if offset else 'wb') as f:
+        for chunk in response.iter_content(chunk_size):
+            if not chunk:
+                continue
+            if throttle is not None:
+                throttle(len(chunk))
+            f.write(chunk)
             bytes_so_far += len(chunk)
-            progress = round(bytes_so_far * 1.0 / total_size * 100)
-            if signal is not None:
-                signal.emit(progress)
-        return content
+            if callback is not None:
+                callback(bytes_so_far, total_size)
+        f.flush()
+        os.fsync(f.fileno())
+    if not bytes_so_far:
+        os.remove(tmp_path)
+        raise IOError('empty response body')
+    if total_size is not None and bytes_so_far != total_size:
+        # keep the part file, so the download can be resumed later
+        raise IOError('incomplete response body: %d/%d'
+                      % (bytes_so_far, total_size))
+    os.replace(tmp_path, f_path)
+    return bytes_so_far
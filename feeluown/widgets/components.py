@@ -36,7 +36,7 @@ class LP_GroupHeader(FFrame):
             }}
         '''.format(self.objectName(),
                    theme.color5_light.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def setup_ui(self):
         self._layout.setContentsMargins(0, 0, 0, 0)
@@ -77,6 +77,9 @@ class LP_GroupItem(FFrame):
     def set_img_text(self, text):
         self._img_label.setText(text)
 
+    def set_name(self, name):
+        self._name_label.setText(name)
+
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton and \
                 self.rect().contains(event.pos()):
@@ -200,13 +203,14 @@ class MusicTable(FTableWidget):
 
     def set_theme_style(self):
         theme = self._app.theme_manager.current_theme
+        # selectors are scoped, since the style is a part of app stylesheet
         style_str = '''
-            QHeaderView {{
+            #{0} QHeaderView {{
                 color: {1};
                 background: transparent;
                 font-size: 14px;
             }}
-            QHeaderView::section:horizontal {{
+            #{0} QHeaderView::section:horizontal {{
                 height: 24px;
                 background: transparent;
                 border-top: 1px;
@@ -218,7 +222,7 @@ class MusicTable(FTableWidget):
                 padding-left: 5px;
             }}
 
-            QTableView QTableCornerButton::section {{
+            #{0} QTableCornerButton::section {{
                 background: transparent;
                 border: 0px;
                 border-bottom: 1px solid {1};
@@ -246,7 +250,7 @@ class MusicTable(FTableWidget):
                    darker(theme.color0, a=30).name(QColor.HexArgb),
                    theme.color0.name(),
                    theme.color7_light.name())
-        self.setStyleSheet(style_str)
+        self._app.theme_manager.add_style(self, style_str)
 
     def add_item(self, song_model):
         music_item = QTableWidgetItem(song_model.title)
@@ -267,6 +271,7 @@ class MusicTable(FTableWidget):
 
     def set_songs(self, songs):
         self.setRowCount(0)
+        self.songs = []
         for song in songs:
             self.add_item(song)
 
@@ -15,6 +15,7 @@ setup(
         'feeluown',
         'feeluown.widgets',
         'feeluown.plugins.neteasemusic',
+        'feeluown.plugins.localmusic',
         ],
     package_data={
         '': ['themes/*.colorscheme', '*.png']
@@ -39,6 +40,7 @@ setup(
     entry_points={
         'console_scripts': [
                 "feeluown=feeluown.__main__:main",
+                "feeluown-daemon=feeluown.daemon:main",
                 "feeluown-install-dev=feeluown.install:install_sys_dep",
                 "feeluown-genicon=feeluown.install:generate_icon",
                 "feeluown-update=feeluown.install:update"
@@ -0,0 +1,22 @@
+import random
+
+from feeluown.shuffle import ShuffleOrder
+
+
+def test_every_round_is_a_permutation():
+    keys = list(range(5))
+    order = ShuffleOrder(rand=random.Random(1))
+    order.reset((key, None) for key in keys)
+    order.set_current(0)
+
+    played = [order.next() for _ in range(len(keys) * 20)]
+    # first round goes on from the key chosen by user
+    rounds = [[0] + played[:len(keys) - 1]]
+    rest = played[len(keys) - 1:]
+    for i in range(0, len(rest) - len(keys) + 1, len(keys)):
+        rounds.append(rest[i:i + len(keys)])
+
+    for keys_of_round in rounds:
+        assert sorted(keys_of_round) == keys
+    for prev, cur in zip(played, played[1:]):
+        assert prev != cur
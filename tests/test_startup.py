@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGINS_DIR = os.path.join(ROOT, 'feeluown', 'plugins')
+
+# seconds, cold import of app and plugins should not exceed it
+IMPORT_BUDGET = 1.5
+
+
+def run_python(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, PLUGINS_DIR])
+    output = subprocess.check_output([sys.executable, '-c', code], env=env,
+                                     universal_newlines=True)
+    return output.strip()
+
+
+def test_cold_import_time():
+    pytest.importorskip('PyQt5')
+    pytest.importorskip('fuocore')
+    pytest.importorskip('requests')
+
+    code = ('import time; start = time.perf_counter(); '
+            'import feeluown.app, neteasemusic, localmusic; '
+            'print(time.perf_counter() - start)')
+    # a fresh interpreter for each run, take the best one to reduce noise
+    cost = min(float(run_python(code)) for _ in range(3))
+    assert cost < IMPORT_BUDGET, \
+        'cold import takes %.2fs, budget is %.2fs' % (cost, IMPORT_BUDGET)
+
+
+def test_heavy_modules_are_lazy():
+    pytest.importorskip('PyQt5')
+    pytest.importorskip('fuocore')
+    pytest.importorskip('requests')
+
+    code = ('import sys; import neteasemusic.nem; '
+            'print(" ".join(m for m in ("bs4", "Crypto") '
+            'if m in sys.modules))')
+    assert run_python(code) == ''